@@ -0,0 +1,36 @@
+"""Import checkpoint
+
+Revision ID: 7f3e9b21c4d8
+Revises: dc216aba5aad
+Create Date: 2026-10-17 11:03:27.514082
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3e9b21c4d8'
+down_revision: Union[str, Sequence[str], None] = 'dc216aba5aad'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('import_checkpoint',
+    sa.Column('patient_id', sa.String(), nullable=False),
+    sa.Column('dataset_partition_id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('imported_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['dataset_partition_id'], ['dataset_partition.id'], ),
+    sa.PrimaryKeyConstraint('patient_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('import_checkpoint')
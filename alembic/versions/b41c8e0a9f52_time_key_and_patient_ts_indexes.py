@@ -0,0 +1,48 @@
+"""Time key and patient ts indexes
+
+Revision ID: b41c8e0a9f52
+Revises: 7f3e9b21c4d8
+Create Date: 2026-10-17 11:48:09.731655
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c8e0a9f52'
+down_revision: Union[str, Sequence[str], None] = '7f3e9b21c4d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+time_series_tables = ['measurement', 'taking_insulin', 'taking_diabetes_tablet', 'dietary_intake']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in time_series_tables:
+        op.add_column(table, sa.Column('ts', sa.DateTime(), nullable=True))
+
+        # backfill from the five integer parts, the way the importer's pd.to_datetime(errors='coerce') builds ts:
+        # an invalid date (a missing part, month 13, 31 April) keeps ts NULL instead of failing the upgrade,
+        # hour and minute are added as offsets (hour 24 is midnight of the next day). CASE makes sure make_date
+        # only runs on valid parts
+        op.execute(
+            f"UPDATE {table} SET ts = make_date(year, month, day) "
+            f"+ make_interval(hours => hour, mins => minute) "
+            f"WHERE CASE WHEN year BETWEEN 1 AND 9999 AND month BETWEEN 1 AND 12 AND day BETWEEN 1 AND 31 "
+            f"AND hour IS NOT NULL AND minute IS NOT NULL "
+            f"THEN day <= extract(day FROM make_date(year, month, 1) + interval '1 month' - interval '1 day') "
+            f"ELSE false END"
+        )
+
+        op.create_index(f'ix_{table}_patient_id_ts', table, ['patient_id', 'ts'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(time_series_tables):
+        op.drop_index(f'ix_{table}_patient_id_ts', table_name=table)
+        op.drop_column(table, 'ts')
@@ -0,0 +1,56 @@
+"""Unique insulin and tablet names
+
+Revision ID: dc216aba5aad
+Revises: 54da4399f7ab
+Create Date: 2026-10-17 10:12:41.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dc216aba5aad'
+down_revision: Union[str, Sequence[str], None] = '54da4399f7ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _merge_duplicate_names(table, reference_table, reference_column):
+    """points the references of duplicate names to the lowest id of the name and deletes the other rows"""
+    bind = op.get_bind()
+    duplicates = bind.execute(sa.text(
+        f'SELECT count(*) FROM {table} t JOIN {table} keep ON keep.name = t.name AND keep.id < t.id'
+    )).scalar()
+
+    if not duplicates:
+        return
+
+    print(f'{table}: merging {duplicates} rows with duplicate names before adding the unique constraint')
+    bind.execute(sa.text(f"""
+        UPDATE {reference_table} r SET {reference_column} = keep.id
+        FROM {table} t JOIN (SELECT name, min(id) AS id FROM {table} GROUP BY name) keep ON keep.name = t.name
+        WHERE r.{reference_column} = t.id AND t.id <> keep.id
+    """))
+    bind.execute(sa.text(
+        f'DELETE FROM {table} t USING {table} keep WHERE keep.name = t.name AND keep.id < t.id'
+    ))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing databases may hold the same name more than once (the old importer queried, then inserted)
+    _merge_duplicate_names('insulin', 'taking_insulin', 'insulin_id')
+    _merge_duplicate_names('diabetes_tablet', 'taking_diabetes_tablet', 'diabetes_tablet_id')
+
+    # INSERT ... ON CONFLICT (name) in DimensionCache needs a unique index on the name
+    op.create_unique_constraint('insulin_name_key', 'insulin', ['name'])
+    op.create_unique_constraint('diabetes_tablet_name_key', 'diabetes_tablet', ['name'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('diabetes_tablet_name_key', 'diabetes_tablet', type_='unique')
+    op.drop_constraint('insulin_name_key', 'insulin', type_='unique')
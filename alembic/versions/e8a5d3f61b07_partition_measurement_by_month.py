@@ -0,0 +1,114 @@
+"""Partition measurement by month
+
+Revision ID: e8a5d3f61b07
+Revises: b41c8e0a9f52
+Create Date: 2026-10-17 12:31:54.106227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a5d3f61b07'
+down_revision: Union[str, Sequence[str], None] = 'b41c8e0a9f52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+measurement_columns = 'id, patient_id, year, month, day, hour, minute, ts, cgm, cbg, blood_ketone'
+
+
+def _measurement_columns(ts_nullable):
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('measurement_id_seq')"), nullable=False),
+        sa.Column('patient_id', sa.String(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=True),
+        sa.Column('month', sa.Integer(), nullable=True),
+        sa.Column('day', sa.Integer(), nullable=True),
+        sa.Column('hour', sa.Integer(), nullable=True),
+        sa.Column('minute', sa.Integer(), nullable=True),
+        sa.Column('ts', sa.DateTime(), nullable=ts_nullable),
+        sa.Column('cgm', sa.Float(), nullable=True),
+        sa.Column('cbg', sa.Float(), nullable=True),
+        sa.Column('blood_ketone', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.id'], ),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.rename_table('measurement', 'measurement_legacy')
+    op.execute("ALTER INDEX measurement_pkey RENAME TO measurement_legacy_pkey")
+    op.execute("ALTER INDEX ix_measurement_patient_id_ts RENAME TO ix_measurement_legacy_patient_id_ts")
+    op.execute("ALTER SEQUENCE measurement_id_seq OWNED BY NONE")  # keep the ids, the sequence moves to the new table
+
+    # the partition key must be part of the primary key, so ts becomes NOT NULL and joins the key
+    op.create_table('measurement',
+    *_measurement_columns(ts_nullable=False),
+    sa.PrimaryKeyConstraint('id', 'ts'),
+    postgresql_partition_by='RANGE (ts)'
+    )
+    op.execute("ALTER SEQUENCE measurement_id_seq OWNED BY measurement.id")
+    op.create_index('ix_measurement_patient_id_ts', 'measurement', ['patient_id', 'ts'], unique=False)
+
+    # one partition per month already present, later months are created by db.partitions.MeasurementPartitions
+    op.execute("""
+        DO $$
+        DECLARE partition_month date;
+        BEGIN
+            FOR partition_month IN
+                SELECT generate_series(date_trunc('month', min(ts)), date_trunc('month', max(ts)), interval '1 month')::date
+                FROM measurement_legacy
+            LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF measurement FOR VALUES FROM (%L) TO (%L)',
+                               'measurement_p' || to_char(partition_month, 'YYYY_MM'),
+                               partition_month, (partition_month + interval '1 month')::date);
+            END LOOP;
+        END $$;
+    """)
+
+    op.execute(f"INSERT INTO measurement ({measurement_columns}) "
+               f"SELECT {measurement_columns} FROM measurement_legacy WHERE ts IS NOT NULL")
+    op.execute("DELETE FROM measurement_legacy WHERE ts IS NOT NULL")
+
+    # rows without a date have no partition, they stay in measurement_legacy; drop it if nothing is left
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM measurement_legacy) THEN
+                DROP TABLE measurement_legacy;
+            ELSE
+                RAISE NOTICE 'measurement rows without ts kept in measurement_legacy';
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER SEQUENCE measurement_id_seq OWNED BY NONE")
+    op.rename_table('measurement', 'measurement_partitioned')
+
+    op.create_table('measurement_plain',
+    *_measurement_columns(ts_nullable=True),
+    sa.PrimaryKeyConstraint('id', name='measurement_plain_pkey')
+    )
+    op.execute(f"INSERT INTO measurement_plain ({measurement_columns}) "
+               f"SELECT {measurement_columns} FROM measurement_partitioned")
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF to_regclass('measurement_legacy') IS NOT NULL THEN
+                INSERT INTO measurement_plain ({measurement_columns}) SELECT {measurement_columns} FROM measurement_legacy;
+                DROP TABLE measurement_legacy;
+            END IF;
+        END $$;
+    """)
+
+    op.drop_table('measurement_partitioned')  # drops every monthly partition with it
+    op.rename_table('measurement_plain', 'measurement')
+    op.execute("ALTER INDEX measurement_plain_pkey RENAME TO measurement_pkey")
+    op.execute("ALTER SEQUENCE measurement_id_seq OWNED BY measurement.id")
+    op.create_index('ix_measurement_patient_id_ts', 'measurement', ['patient_id', 'ts'], unique=False)
@@ -0,0 +1,83 @@
+"""
+per-patient window query on the time-series tables, before and after the (patient_id, ts) index:
+
+  parts     - old style: patient_id plus a (year, month, day, hour, minute) row comparison, no usable index
+  ts, no ix - the ts column with index scans, bitmap scans and partition pruning switched off, i.e. the plan
+              before the migration (measurement is partitioned on ts, pruning alone would skip most of it)
+  ts, ix    - the ts column through ix_<table>_patient_id_ts
+
+run after `alembic upgrade head` on a loaded database: python -m db.benchmark_range_queries
+"""
+import statistics
+import time
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from db.engine import engine
+
+TABLES = ['measurement', 'taking_insulin', 'taking_diabetes_tablet', 'dietary_intake']
+WINDOW_DAYS = 3
+REPEATS = 20
+
+
+def _pick_window(table):
+    # the patient with most rows, window starting at its first timestamp
+    with engine.connect() as connection:
+        return connection.execute(text(
+            f"SELECT patient_id, min(ts) FROM {table} WHERE ts IS NOT NULL "
+            f"GROUP BY patient_id ORDER BY count(*) DESC LIMIT 1"
+        )).first()
+
+
+def _median_ms(sql, params, before_migration=False):
+    timings = []
+
+    for _ in range(REPEATS):
+        with engine.begin() as connection:
+            if before_migration:
+                # no (patient_id, ts) index and no ts partitions: every partition is scanned sequentially
+                connection.execute(text("SET LOCAL enable_indexscan = off"))
+                connection.execute(text("SET LOCAL enable_bitmapscan = off"))
+                connection.execute(text("SET LOCAL enable_partition_pruning = off"))
+
+            started = time.perf_counter()
+            connection.execute(text(sql), params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    return statistics.median(timings)
+
+
+def main():
+    for table in TABLES:
+        window = _pick_window(table)
+        if window is None:
+            print(f'{table}: no rows with ts, skipped')
+            continue
+
+        patient_id, start = window
+        end = start + timedelta(days=WINDOW_DAYS)
+
+        params = {
+            'patient_id': patient_id, 'start': start, 'end': end,
+            'y0': start.year, 'mo0': start.month, 'd0': start.day, 'h0': start.hour, 'mi0': start.minute,
+            'y1': end.year, 'mo1': end.month, 'd1': end.day, 'h1': end.hour, 'mi1': end.minute,
+        }
+
+        parts_sql = (
+            f"SELECT * FROM {table} WHERE patient_id = :patient_id "
+            f"AND (year, month, day, hour, minute) >= (:y0, :mo0, :d0, :h0, :mi0) "
+            f"AND (year, month, day, hour, minute) < (:y1, :mo1, :d1, :h1, :mi1)"
+        )
+        ts_sql = f"SELECT * FROM {table} WHERE patient_id = :patient_id AND ts >= :start AND ts < :end"
+
+        parts_ms = _median_ms(parts_sql, params, before_migration=True)
+        ts_no_index_ms = _median_ms(ts_sql, params, before_migration=True)
+        ts_index_ms = _median_ms(ts_sql, params)
+        speedup = ts_no_index_ms / ts_index_ms if ts_index_ms else float('inf')
+
+        print(f'{table} ({WINDOW_DAYS}-day window of {patient_id}): parts {parts_ms:.2f} ms | '
+              f'ts, no ix {ts_no_index_ms:.2f} ms | ts, ix {ts_index_ms:.2f} ms ({speedup:.1f}x)')
+
+
+if __name__ == '__main__': main()
@@ -0,0 +1,72 @@
+import io
+import time
+
+from sqlalchemy import insert
+
+from utils.convert_python_format import to_python_records
+
+
+class IngestStats:
+    def __init__(self):
+        self.tables = {}  # table name -> [rows, seconds]
+
+    def track(self, table_name, rows, seconds):
+        entry = self.tables.setdefault(table_name, [0, 0.0])
+        entry[0] += rows
+        entry[1] += seconds
+
+    def report(self, label):
+        for table_name, (rows, seconds) in self.tables.items():
+            if not rows:
+                print(f'[{label}] {table_name}: {seconds:.2f}s')
+                continue
+
+            rate = rows / seconds if seconds else float('inf')
+            print(f'[{label}] {table_name}: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/sec)')
+
+
+class BulkWriter:
+    """
+    writes columnar frames straight into a table without building ORM objects.
+
+    method='copy'   - streams the frame as csv into postgres with COPY FROM STDIN (fastest)
+    method='insert' - one insert().values executemany over the frame records (any dialect)
+    """
+
+    methods = ('copy', 'insert')
+
+    def __init__(self, session, method='copy'):
+        if method not in self.methods:
+            raise ValueError(f"unknown bulk method {method}, expected one of {self.methods}")
+
+        self.session = session
+        self.method = method
+        self.stats = IngestStats()
+
+    def write(self, table, frame):
+        if frame.empty: return 0
+
+        started = time.perf_counter()
+
+        if self.method == 'copy':
+            self._copy(table, frame)
+        else:
+            self._insert(table, frame)
+
+        self.stats.track(table.name, len(frame), time.perf_counter() - started)
+        return len(frame)
+
+    def _copy(self, table, frame):
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False)  # NaN / <NA> -> empty field -> NULL
+        buffer.seek(0)
+
+        columns = ', '.join(frame.columns)
+        cursor = self.session.connection().connection.cursor()  # raw psycopg2 cursor of the session transaction
+        try:
+            cursor.copy_expert(f'COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+
+    def _insert(self, table, frame):
+        self.session.execute(insert(table), to_python_records(frame))
@@ -0,0 +1,51 @@
+from sqlalchemy.dialects.postgresql import insert
+
+
+class DimensionCache:
+    """
+    name -> id cache for a small dimension table (insulin, diabetes_tablet).
+
+    the whole table is loaded with one query on creation, unknown names are inserted in one batch
+    with INSERT ... ON CONFLICT (name) DO NOTHING and read back, so the import loop never queries
+    the table for a name it has already seen.
+    """
+
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+        self.ids = dict(session.query(model.name, model.id).all())
+        self.hits = 0
+        self.misses = 0
+
+    def get_id(self, name: str) -> int:
+        return self.get_ids([name])[name]
+
+    def get_ids(self, names) -> dict:
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names if name not in self.ids]
+
+        self.hits += len(names) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            self._upsert(missing)
+
+        return {name: self.ids[name] for name in names}
+
+    def _upsert(self, names):
+        statement = (
+            insert(self.model.__table__)
+            .values([{'name': name} for name in names])
+            .on_conflict_do_nothing(index_elements=['name'])
+        )
+        self.session.execute(statement)
+
+        # rows created by another importer in the meantime are not returned by DO NOTHING, so read all back
+        created = self.session.query(self.model.name, self.model.id).filter(self.model.name.in_(names)).all()
+        self.ids.update(created)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        print(f'[cache] {self.model.__tablename__}: {self.hits} hits, {self.misses} misses '
+              f'({hit_rate:.1%} hit rate, {len(self.ids)} names)')
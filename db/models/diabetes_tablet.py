@@ -11,4 +11,4 @@ class DiabetesTablets(Base):
 
     taking_tablets = relationship("TakingDiabetesTablet", back_populates="diabetes_tablet")
 
-    name = Column(String)
+    name = Column(String, unique=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from db.base import Base
@@ -6,6 +6,7 @@ from db.base import Base
 
 class DietaryIntake(Base):
     __tablename__ = "dietary_intake"
+    __table_args__ = (Index("ix_dietary_intake_patient_id_ts", "patient_id", "ts"),)
 
     id = Column(Integer, primary_key=True, nullable=False)
     patient_id = Column(String, ForeignKey("patient.id"), nullable=False)
@@ -15,5 +16,6 @@ class DietaryIntake(Base):
     day = Column(Integer)
     hour = Column(Integer)
     minute = Column(Integer)
+    ts = Column(DateTime)
 
     patient = relationship("Patient", back_populates="dietary_intake")
\ No newline at end of file
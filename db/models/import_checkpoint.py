@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, func
+
+from db.base import Base
+
+
+class ImportCheckpoint(Base):
+    __tablename__ = 'import_checkpoint'
+
+    patient_id = Column(String, primary_key=True, nullable=False)
+    dataset_partition_id = Column(Integer, ForeignKey("dataset_partition.id"), nullable=False)
+
+    content_hash = Column(String(64), nullable=False)  # sha256 of the patient's csv rows
+    rows = Column(Integer, nullable=False)
+    imported_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -11,4 +11,4 @@ class Insulin(Base):
 
     taking_insulins = relationship("TakingInsulin", back_populates="insulin")
 
-    name = Column(String)
\ No newline at end of file
+    name = Column(String, unique=True)
\ No newline at end of file
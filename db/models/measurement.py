@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from db.base import Base
@@ -6,8 +6,14 @@ from db.base import Base
 
 class Measurement(Base):
     __tablename__ = "measurement"
-
-    id = Column(Integer, primary_key=True, nullable=False)
+    __table_args__ = (
+        Index("ix_measurement_patient_id_ts", "patient_id", "ts"),
+        # monthly range partitions on ts, created on demand by db.partitions.MeasurementPartitions
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+
+    # the partition key has to be part of the primary key of a partitioned table
+    id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     patient_id = Column(String, ForeignKey("patient.id"), nullable=False)
 
     year = Column(Integer)
@@ -15,10 +21,10 @@ class Measurement(Base):
     day = Column(Integer)
     hour = Column(Integer)
     minute = Column(Integer)
+    ts = Column(DateTime, primary_key=True, nullable=False)  # year..minute as one timestamp, partition key
 
     cgm = Column(Float)
     cbg = Column(Float)
     blood_ketone = Column(Float)
 
     patient = relationship("Patient", back_populates="measurements")
-
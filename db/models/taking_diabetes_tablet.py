@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from db.base import Base
@@ -6,6 +6,7 @@ from db.base import Base
 
 class TakingDiabetesTablet(Base):
     __tablename__ = 'taking_diabetes_tablet'
+    __table_args__ = (Index('ix_taking_diabetes_tablet_patient_id_ts', 'patient_id', 'ts'),)
 
     id = Column(Integer, primary_key=True, nullable=False)
     patient_id = Column(String, ForeignKey("patient.id"), nullable=False)
@@ -19,5 +20,6 @@ class TakingDiabetesTablet(Base):
     day = Column(Integer)
     hour = Column(Integer)
     minute = Column(Integer)
+    ts = Column(DateTime)
 
     dose = Column(Float)
@@ -0,0 +1,67 @@
+import pandas as pd
+from sqlalchemy import event, text
+
+from db.models import Measurement
+
+
+class MeasurementPartitions:
+    """
+    monthly range partitions of the measurement table (measurement_pYYYY_MM).
+
+    the existing partitions are read once, a missing month is created right before the first row of that
+    month is written. old months can be detached cheaply and archived or dropped as a plain table.
+
+    the DDL runs in the session's transaction (a second connection would wait on the locks of the rows the
+    import already wrote), so a created partition is only recorded once that transaction commits - after a
+    rollback it is created again.
+    """
+
+    table = Measurement.__tablename__
+
+    def __init__(self, session):
+        self.session = session
+        self.existing = set(self.session.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {'table': self.table}).scalars())
+        self.pending = set()  # created in the open transaction
+
+        event.listen(session, 'after_commit', self._committed)
+        event.listen(session, 'after_rollback', self._rolled_back)
+
+    def _committed(self, session):
+        self.existing |= self.pending
+        self.pending.clear()
+
+    def _rolled_back(self, session):
+        self.pending.clear()
+
+    @classmethod
+    def partition_name(cls, month: pd.Period) -> str:
+        return f'{cls.table}_p{month.year:04d}_{month.month:02d}'
+
+    def _quote(self, name):
+        return self.session.get_bind().dialect.identifier_preparer.quote(name)
+
+    def ensure(self, timestamps):
+        months = pd.to_datetime(pd.Series(timestamps)).dropna().dt.to_period('M').unique()
+
+        for month in sorted(months):
+            name = self.partition_name(month)
+            if name in self.existing or name in self.pending: continue
+
+            self.session.execute(
+                text(f"CREATE TABLE IF NOT EXISTS {self._quote(name)} PARTITION OF {self._quote(self.table)} "
+                     f"FOR VALUES FROM (:start) TO (:end)"),
+                {'start': month.start_time.date(), 'end': (month + 1).start_time.date()},
+            )
+            self.pending.add(name)
+
+    def detach(self, month: pd.Period):
+        name = self.partition_name(pd.Period(month, freq='M'))
+        self.session.execute(text(f"ALTER TABLE {self._quote(self.table)} DETACH PARTITION {self._quote(name)}"))
+        self.existing.discard(name)
+        self.pending.discard(name)
+        return name
@@ -3,9 +3,22 @@ from pathlib import Path
 from load_data_to_db import DataImporter
 
 
-def main():
+def main(bulk_method=None, workers=None, incremental=False, chunksize=None, parquet=False):
+    # bulk_method: None (orm), 'copy' or 'insert'; workers: process pool size; incremental: skip unchanged patients
+    # chunksize: stream the source in chunks of this many rows instead of loading it whole
+    # parquet: read the DfFullData.export_parquet dataset (partitioned by split) instead of the csv files
     root_dir = Path(__file__).resolve().parent
 
+    if parquet:
+        dataset = root_dir / "cleaned_data" / "shanghai_parquet"
+        for split in ('train', 'test'):
+            if not (dataset / f'split={split}').exists():
+                print(f"dataset partition is not exist: {split}")
+                return
+
+        _import(DataImporter('train'), dataset, bulk_method, workers, incremental, chunksize)
+        return
+
     data = {
         'train': {
             'name': 'train',
@@ -26,8 +39,18 @@ def main():
         print(f"file is not exist: {data['test']['name']}")
         return
 
-    importer = DataImporter(data['train']['name'])
-    importer.import_from_data(str(data['train']['file']))
+    _import(DataImporter(data['train']['name']), data['train']['file'], bulk_method, workers, incremental, chunksize)
+
+
+def _import(importer, source, bulk_method, workers, incremental, chunksize):
+    if incremental:
+        importer.import_from_data_incremental(str(source), bulk_method or 'copy', chunksize)
+    elif workers:
+        importer.import_from_data_parallel(str(source), workers, bulk_method or 'copy')
+    elif bulk_method:
+        importer.import_from_data_bulk(str(source), bulk_method, chunksize)
+    else:
+        importer.import_from_data(str(source), chunksize)
 
 
 if __name__ == '__main__': main()
@@ -1,18 +1,35 @@
+import hashlib
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from db.engine import engine
+from db.bulk_writer import BulkWriter, IngestStats
+from db.dimension_cache import DimensionCache
+from db.engine import engine, DATABASE_URL
+from db.partitions import MeasurementPartitions
 from db.models import Patient, PatientMedicalStatic, AdditionalDrugs, Comorbidities, \
-    DatasetPartition, DietaryIntake, Measurement, Insulin, DiabetesTablets, TakingInsulin, TakingDiabetesTablet
-from utils.convert_python_format import to_python_format
+    DatasetPartition, DietaryIntake, Measurement, Insulin, DiabetesTablets, TakingInsulin, TakingDiabetesTablet, \
+    ImportCheckpoint
+from utils.convert_python_format import to_python_format, to_python_records
 
 
 class DataImporter:
-    def __init__(self, partition_name: str):
+    def __init__(self, partition_name: str, bind=None):
         Session = sessionmaker(
-            bind=engine)  # creates a session factory class that knows what engine it is connecting to.
+            bind=bind or engine)  # creates a session factory class that knows what engine it is connecting to.
         self.session = Session()  # start a new session (connection to the database) with which we work.
         self.partition = self._get_or_create_partition(partition_name)
+        self.insulin_cache = DimensionCache(self.session, Insulin)  # name -> id, preloaded with one query
+        self.diabetes_tablet_cache = DimensionCache(self.session, DiabetesTablets)
+        self.measurement_partitions = MeasurementPartitions(self.session)
+        self.untimed_measurements = 0  # measurement rows without a valid date, see _expand_group
 
     additional_drug_columns = [
         "has_ace_inhibitors", "has_angioprotectors", "has_antianginal", "has_antiarrhythmic",
@@ -42,36 +59,356 @@ class DataImporter:
         'dose_insulin_degludec'
     ]
 
-    def import_from_data(self, file_path: str):
-        try:
-            df = pd.read_csv(file_path)
+    diabetes_tablet_columns = [
+        'dose_dapagliflozin', 'dose_metformin', 'dose_sitagliptinphosphate_metforminhydrochloride',
+        'dose_voglibose', 'dose_repaglinide', 'dose_gliclazide', 'dose_acarbose', 'dose_liraglutide',
+        'dose_sitagliptin', 'dose_gliquidone', 'dose_canagliflozin', 'dose_pioglitazone',
+        'dose_glimepiride', 'dose_empagliflozin', 'dose_linagliptin'
+    ]
+
+    time_columns = {
+        'year_treat': 'year',
+        'month_treat': 'month',
+        'day_treat': 'day',
+        'hour_of_day_treat': 'hour',
+        'minute_treat': 'minute',
+    }
+
+    measurement_columns = {
+        'CGM (mg / dl)': 'cgm',
+        'CBG (mg / dl)': 'cbg',
+        'Blood Ketone (mmol / L)': 'blood_ketone',
+    }
+
+    # first-row columns of _import_patient / _import_medical_static
+    static_columns = [
+        'Gender (Female=1, Male=2)', 'Age (years)', 'Height (m)', 'Weight (kg)', 'Smoking History (pack year)',
+        'Alcohol Drinking History (drinker/non-drinker)', 'Type of Diabetes', 'Duration of Diabetes (years)',
+        'Fasting Plasma Glucose (mg/dl)', '2-hour Postprandial Plasma Glucose (mg/dl)', 'Fasting C-peptide (nmol/L)',
+        '2-hour Postprandial C-peptide (nmol/L)', 'Fasting Insulin (pmol/L)', '2-hour Postprandial Insulin (pmol/L)',
+        'HbA1c (mmol/mol)', 'Glycated Albumin (%)', 'Total Cholesterol (mmol/L)', 'Triglyceride (mmol/L)',
+        'High-Density Lipoprotein Cholesterol (mmol/L)', 'Low-Density Lipoprotein Cholesterol (mmol/L)',
+        'Creatinine (umol/L)', 'Estimated Glomerular Filtration Rate  (ml/min/1.73m2)', 'Uric Acid (mmol/L)',
+        'Blood Urea Nitrogen (mmol/L)',
+    ]
+
+    def import_from_data(self, file_path: str, chunksize: int = None):
+        stats = IngestStats()
 
-            for patient_id, group in df.groupby('Patient Number'):
+        try:
+            for patient_id, group in self._read_patient_groups(file_path, chunksize):
                 first_row = group.iloc[0]
                 self._import_patient(patient_id, first_row)
                 self._import_medical_static(patient_id, first_row)
                 self._import_additional_drugs(patient_id, first_row)
                 self._import_comorbidities(patient_id, first_row)
 
-                self._import_dietary_intake(patient_id, group)
-                self._import_measurement(patient_id, group)
-                self._import_insulin_dose(patient_id, group)
-                self._import_diabetes_tablet(patient_id, group)
+                frames = self._expand_group(patient_id, group)
+
+                self._timed(stats, DietaryIntake, self._import_dietary_intake, patient_id, frames)
+                self._timed(stats, Measurement, self._import_measurement, patient_id, frames)
+                self._timed(stats, TakingInsulin, self._import_insulin_dose, patient_id, frames)
+                self._timed(stats, TakingDiabetesTablet, self._import_diabetes_tablet, patient_id, frames)
 
+            started = time.perf_counter()
             self.session.commit()
+            stats.track('commit (flush of all orm objects)', 0, time.perf_counter() - started)
         except Exception as e:
             self.session.rollback()
             raise TypeError(f"Error during import from {file_path}: {e}")
 
+        stats.report('orm')
+        self._report_caches()
+        self._report_untimed_measurements()
+        return stats
+
+    def import_from_data_bulk(self, file_path: str, method: str = 'copy', chunksize: int = None):
+        """
+        same result as import_from_data, but the time-series tables (measurement, dietary_intake,
+        taking_insulin, taking_diabetes_tablet) are written per patient as columnar frames through
+        BulkWriter (COPY FROM STDIN or insert executemany) instead of one ORM object per row.
+        """
+        writer = BulkWriter(self.session, method)
+
+        try:
+            for patient_id, group in self._read_patient_groups(file_path, chunksize):
+                self._import_group_bulk(writer, patient_id, group)
+
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise TypeError(f"Error during bulk import from {file_path}: {e}")
+
+        writer.stats.report(f'bulk {method}')
+        self._report_caches()
+        self._report_untimed_measurements()
+        return writer.stats
+
+    def import_from_data_parallel(self, file_path: str, workers: int = None, method: str = 'copy',
+                                  transaction_rows: int = 50_000):
+        """
+        shards the patients of the file over a process pool. every worker opens its own engine and
+        commits one batch of whole patients (about transaction_rows csv rows) per transaction, so a failing
+        batch is rolled back alone and reported instead of undoing the whole file.
+        """
+        df = self._read_source(file_path)
+
+        self._resolve_dimensions(df)
+        self.session.commit()  # partition, insulin, tablet rows and measurement partitions must be visible to the workers
+
+        stats = IngestStats()
+        failed = {}
+        imported = 0
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.partition.name, method)) as pool:
+            futures = [pool.submit(_import_batch, batch) for batch in self._patient_batches(df, transaction_rows)]
+
+            for future in as_completed(futures):
+                patient_ids, tables, error = future.result()
+
+                if error:
+                    print(f'[ERROR] batch of {len(patient_ids)} patients rolled back: {error}')
+                    failed.update({patient_id: error for patient_id in patient_ids})
+                    continue
+
+                imported += len(patient_ids)
+                for table_name, (rows, seconds) in tables.items():
+                    stats.track(table_name, rows, seconds)
+
+        stats.track('wall clock', 0, time.perf_counter() - started)
+        stats.report(f'parallel {method}')
+        print(f'imported {imported} patients, failed {len(failed)}')
+        self._report_untimed_measurements()
+        return stats, failed
+
+    def import_from_data_incremental(self, file_path: str, method: str = 'copy', chunksize: int = None):
+        """
+        idempotent reload: every patient is committed in its own transaction together with a checkpoint
+        holding the hash of its csv rows. patients whose hash did not change are skipped, changed or
+        half-imported patients are deleted and imported again, so an interrupted run resumes where it stopped.
+        """
+        writer = BulkWriter(self.session, method)
+
+        checkpoints = dict(self.session.query(ImportCheckpoint.patient_id, ImportCheckpoint.content_hash).all())
+        skipped, imported = 0, 0
+
+        for patient_id, group in self._read_patient_groups(file_path, chunksize):
+            content_hash = self._content_hash(group)
+
+            if checkpoints.get(str(patient_id)) == content_hash:
+                skipped += 1
+                continue
+
+            try:
+                self._delete_patient_rows(patient_id)
+                self._import_group_bulk(writer, patient_id, group)
+                self.session.merge(ImportCheckpoint(
+                    patient_id=str(patient_id),
+                    dataset_partition_id=self.partition.id,
+                    content_hash=content_hash,
+                    rows=len(group),
+                    imported_at=datetime.now(),
+                ))
+                self.session.commit()
+                imported += 1
+            except Exception as e:
+                self.session.rollback()
+                raise TypeError(f"Error during incremental import of patient {patient_id} from {file_path}: {e}")
+
+        writer.stats.report(f'incremental {method}')
+        print(f'imported {imported} patients, skipped {skipped} unchanged')
+        self._report_untimed_measurements()
+        return writer.stats
+
+    def _content_hash(self, group):
+        """
+        hash of what the importer reads, independent of the source format: the imported columns in a fixed
+        order, every value in one canonical form - a csv "1", an int8 / category 1 from parquet and 1.0 hash alike
+        """
+        columns = self._imported_columns(group.columns)
+        digest = hashlib.sha256('|'.join(columns).encode())
+
+        for col in columns:
+            digest.update(pd.util.hash_pandas_object(self._canonical(group[col]), index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
     @staticmethod
-    def _extract_time_fields(row):
-        return {
-            'year': to_python_format(row.get("year_treat")),
-            'month': to_python_format(row.get("month_treat")),
-            'day': to_python_format(row.get("day_treat")),
-            'hour': to_python_format(row.get("hour_of_day_treat")),
-            'minute': to_python_format(row.get("minute_treat")),
-        }
+    def _canonical(values):
+        # numbers as float64 text, other values as stripped text, missing values as ''
+        text = pd.Series(values.to_numpy(dtype=object)).astype(str).str.strip()
+        text = text.where(pd.Series(values.notna().to_numpy()), '')
+        numbers = pd.to_numeric(text, errors='coerce')
+        return numbers.astype(str).where(numbers.notna(), text)
+
+    def _imported_columns(self, names):
+        """the columns the importer uses that are among names, in one fixed order"""
+        wanted = ['Patient Number', 'Dietary intake', *self.static_columns, *self.time_columns,
+                  *self.measurement_columns, *self.insulin_columns, *self.diabetes_tablet_columns,
+                  *self.additional_drug_columns, *self.comorbidities_columns]
+        return [col for col in dict.fromkeys(wanted) if col in set(names)]
+
+    def _delete_patient_rows(self, patient_id):
+        # children first, the patient row last because of the foreign keys
+        for model in (Measurement, DietaryIntake, TakingInsulin, TakingDiabetesTablet,
+                      PatientMedicalStatic, AdditionalDrugs, Comorbidities):
+            self.session.query(model).filter_by(patient_id=str(patient_id)).delete(synchronize_session=False)
+
+        self.session.query(Patient).filter_by(id=str(patient_id)).delete(synchronize_session=False)
+
+    def import_patient_batch(self, batch, method: str = 'copy'):
+        """imports [(patient_id, group), ...] in one transaction, returns (patient ids, stats tables, error)"""
+        writer = BulkWriter(self.session, method)
+        patient_ids = [str(patient_id) for patient_id, _ in batch]
+
+        try:
+            for patient_id, group in batch:
+                self._import_group_bulk(writer, patient_id, group)
+
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            return patient_ids, {}, str(e)
+
+        return patient_ids, writer.stats.tables, None
+
+    def _read_patient_groups(self, file_path, chunksize=None):
+        """
+        yields (patient_id, group). without chunksize the whole file is read and grouped in memory,
+        with chunksize the source is streamed and peak memory is bounded by the largest patient.
+        """
+        if not chunksize:
+            yield from self._read_source(file_path).groupby('Patient Number')
+            return
+
+        yield from self._stream_patient_groups(file_path, chunksize)
+
+    @staticmethod
+    def _is_parquet(file_path):
+        # a parquet dataset directory (DfFullData.export_parquet) or a single .parquet file
+        return Path(file_path).is_dir() or Path(file_path).suffix == '.parquet'
+
+    def _read_source(self, file_path):
+        if self._is_parquet(file_path):
+            return self._from_arrow(self._parquet_scanner(file_path).to_table())
+
+        return pd.read_csv(file_path, dtype=self._csv_dtypes(file_path))
+
+    def _source_chunks(self, file_path, chunksize):
+        if self._is_parquet(file_path):
+            return (self._from_arrow(batch) for batch in self._parquet_scanner(file_path, chunksize).to_batches()
+                    if batch.num_rows)  # files of other splits give empty batches
+
+        return pd.read_csv(file_path, dtype=self._csv_dtypes(file_path), chunksize=chunksize)
+
+    def _parquet_scanner(self, file_path, batch_size=None):
+        """
+        only the columns the importer uses are read, and in a dataset partitioned by split only the files
+        of this partition (split == partition name) are opened
+        """
+        dataset = ds.dataset(file_path, format='parquet', partitioning='hive')
+        columns = self._imported_columns(dataset.schema.names)
+
+        split_filter = ds.field('split') == self.partition.name if 'split' in dataset.schema.names else None
+
+        options = {'batch_size': batch_size} if batch_size else {}
+        return dataset.scanner(columns=columns, filter=split_filter, **options)
+
+    @staticmethod
+    def _from_arrow(data):
+        frame = data.to_pandas()
+        frame['Patient Number'] = frame['Patient Number'].astype(str)  # a partition column comes back as category
+        return frame
+
+    def _stream_patient_groups(self, file_path, chunksize):
+        # the merged data keeps every patient's rows together, only the last patient of a chunk can be incomplete
+        carry = None
+        finished = set()
+
+        for chunk in self._source_chunks(file_path, chunksize):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+
+            # every patient of the chunk, the carried one included, must be one block not seen before
+            patients = chunk['Patient Number'].to_numpy()
+            blocks = pd.Series(patients[np.r_[True, patients[1:] != patients[:-1]]])
+            repeated = blocks[blocks.isin(finished) | blocks.duplicated()]
+            if not repeated.empty:
+                raise ValueError(f"rows of patient {repeated.iloc[0]} are not contiguous in {file_path}, "
+                                 f"streaming import needs the data grouped by 'Patient Number'")
+
+            is_last = patients == patients[-1]
+            carry = chunk[is_last]
+
+            for patient_id, group in chunk[~is_last].groupby('Patient Number', sort=False):
+                finished.add(patient_id)
+                yield patient_id, group
+
+        if carry is not None and not carry.empty:
+            yield carry['Patient Number'].iloc[0], carry
+
+    def _csv_dtypes(self, file_path):
+        # explicit dtypes: no type inference per chunk and no mixed-type columns between chunks.
+        # 0/1 flags are read as text - a chunk with a missing flag would otherwise read "1" as 1.0
+        header = pd.read_csv(file_path, nrows=0).columns
+        dtypes = {'Patient Number': str}
+        flag_columns = {'Dietary intake', *self.additional_drug_columns, *self.comorbidities_columns}
+
+        for col in header:
+            if col in flag_columns:
+                dtypes[col] = str
+            elif col in self.time_columns or col in self.measurement_columns or col in self.static_columns \
+                    or col in self.insulin_columns or col in self.diabetes_tablet_columns:
+                dtypes[col] = 'float64'
+
+        return dtypes
+
+    def _import_group_bulk(self, writer, patient_id, group):
+        first_row = group.iloc[0]
+        self._import_patient(patient_id, first_row)
+        self._import_medical_static(patient_id, first_row)
+        self._import_additional_drugs(patient_id, first_row)
+        self._import_comorbidities(patient_id, first_row)
+        self.session.flush()  # patient row must exist before COPY checks the foreign keys
+
+        frames = self._expand_group(patient_id, group)
+
+        for model in (DietaryIntake, Measurement, TakingInsulin, TakingDiabetesTablet):
+            writer.write(model.__table__, frames[model.__tablename__])
+
+    def _resolve_dimensions(self, df):
+        for dose_columns, cache in ((self.insulin_columns, self.insulin_cache),
+                                    (self.diabetes_tablet_columns, self.diabetes_tablet_cache)):
+            used = [col for col in dose_columns
+                    if col in df.columns and (pd.to_numeric(df[col], errors='coerce') > 0).any()]
+            cache.get_ids(self._dose_name(col) for col in used)
+
+        # DDL once in the parent, workers creating partitions would lock each other out of the measurement table
+        timestamps = self._time_frame('', df)['ts']
+        self.measurement_partitions.ensure(timestamps)
+        self.untimed_measurements = int(timestamps.isna().sum())  # the workers skip the same rows
+
+    @staticmethod
+    def _patient_batches(df, transaction_rows):
+        batches, batch, rows = [], [], 0
+
+        for patient_id, group in df.groupby('Patient Number'):
+            batch.append((patient_id, group))
+            rows += len(group)
+
+            if rows >= transaction_rows:
+                batches.append(batch)
+                batch, rows = [], 0
+
+        if batch: batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _timed(stats, model, import_method, patient_id, frames):
+        started = time.perf_counter()
+        rows = import_method(patient_id, frames[model.__tablename__])
+        stats.track(model.__tablename__, rows, time.perf_counter() - started)
 
     def _import_patient(self, patient_id, first_row):
         try:
@@ -125,7 +462,7 @@ class DataImporter:
             for column_name in self.additional_drug_columns:
                 value = first_row.get(column_name)
 
-                if pd.notna(value) and str(value).strip() == '1':
+                if self._is_set(value):
                     drug_name = column_name.replace('has_', '').replace('_', ' ').title()
                     drug = AdditionalDrugs(
                         patient_id=str(patient_id),
@@ -141,7 +478,7 @@ class DataImporter:
             for col_name in self.comorbidities_columns:
                 value = first_row.get(col_name)
 
-                if pd.notna(value) and str(value).strip() == '1':
+                if self._is_set(value):
                     concomitant_name = col_name.replace('has_', '').replace('_', ' ').title()
                     concomitant = Comorbidities(
                         patient_id=str(patient_id),
@@ -151,101 +488,113 @@ class DataImporter:
         except Exception as e:
             raise TypeError(f"[ERROR] import_additional_drugs for ID {patient_id}: {e}")
 
-    def _import_dietary_intake(self, patient_id, group):
-        try:
-            for index, row in group.iterrows():
-                value = row.get('Dietary intake')
-                if pd.notna(value) and str(value).strip() == '1':
-                    time_fields = self._extract_time_fields(row)
+    @staticmethod
+    def _is_set(value):
+        # a 0/1 flag: "1", 1 and 1.0 (a csv written from a float column) all mean set
+        return pd.notna(value) and pd.to_numeric(str(value).strip(), errors='coerce') == 1
 
-                    dietary = DietaryIntake(
-                        patient_id=str(patient_id),
-                        **time_fields
-                    )
-                    self.session.add(dietary)
+    def _import_dietary_intake(self, patient_id, frame):
+        try:
+            self.session.add_all(DietaryIntake(**record) for record in to_python_records(frame))
+            return len(frame)
         except Exception as e:
             raise TypeError(f"[ERROR] import_dietary_intake for ID {patient_id}: {e}")
 
-    def _import_measurement(self, patient_id, group):
+    def _import_measurement(self, patient_id, frame):
         try:
-            for _, row in group.iterrows():
-                cgm = row.get('CGM (mg / dl)')
-                cbg = row.get('CBG (mg / dl)')
-                blood_ketone = row.get('Blood Ketone (mmol / L)')
-                time_fields = self._extract_time_fields(row)
-
-                measurement = Measurement(
-                    patient_id=str(patient_id),
-                    **time_fields,
-                    cgm=to_python_format(cgm) if pd.notna(cgm) else 0.0,
-                    cbg=to_python_format(cbg) if pd.notna(cbg) else 0.0,
-                    blood_ketone=to_python_format(blood_ketone) if pd.notna(blood_ketone) else 0.0,
-
-                )
-                self.session.add(measurement)
-
+            self.session.add_all(Measurement(**record) for record in to_python_records(frame))
+            return len(frame)
         except Exception as e:
             raise TypeError(f'[ERROR] _import_measurement for ID {patient_id}: {e}')
 
-
-    def _import_insulin_dose(self, patient_id, group):
+    def _import_insulin_dose(self, patient_id, frame):
         try:
-
-            for _, row in group.iterrows():
-                time_fields = self._extract_time_fields(row)
-
-                for col in self.insulin_columns:
-                    dose_value = row.get(col)
-                    if pd.notna(dose_value) and float(dose_value) > 0:
-                        insulin_name = col.replace("dose_", "").replace("_", " ").title()
-                        insulin_id = self._get_or_create_insulin_id(insulin_name)
-
-                        taking = TakingInsulin(
-                            patient_id=str(patient_id),
-                            insulin_id=insulin_id,
-                            dose=to_python_format(float(dose_value)),
-                            **time_fields
-                        )
-                        self.session.add(taking)
-
+            self.session.add_all(TakingInsulin(**record) for record in to_python_records(frame))
+            return len(frame)
         except Exception as e:
             self.session.rollback()
             raise TypeError(f'[ERROR] import_insulin_doses for ID {patient_id}: {e}')
 
-
-    def _import_diabetes_tablet(self, patient_id, group):
+    def _import_diabetes_tablet(self, patient_id, frame):
         try:
-            diabetes_tablet_cols = [
-                'dose_dapagliflozin', 'dose_metformin', 'dose_sitagliptinphosphate_metforminhydrochloride',
-                'dose_voglibose', 'dose_repaglinide', 'dose_gliclazide', 'dose_acarbose', 'dose_liraglutide',
-                'dose_sitagliptin', 'dose_gliquidone', 'dose_canagliflozin', 'dose_pioglitazone',
-                'dose_glimepiride', 'dose_empagliflozin', 'dose_linagliptin'
-            ]
-
-            for _, row in group.iterrows():
-                time_fields = self._extract_time_fields(row)
-
-                for col in diabetes_tablet_cols:
-                    dose_value = row.get(col)
-
-                    if pd.notna(dose_value) and float(dose_value) > 0:
-                        diabetes_tablet = col.replace("dose_", "").replace("_", " ").title()
-                        diabetes_tablet_id = self._get_or_create_diabetes_tablet(diabetes_tablet)
-
-                        taking = TakingDiabetesTablet(
-                            patient_id=str(patient_id),
-                            diabetes_tablet_id=diabetes_tablet_id,
-                            dose=to_python_format(float(dose_value)),
-                            **time_fields
-                        )
-                        self.session.add(taking)
-
+            self.session.add_all(TakingDiabetesTablet(**record) for record in to_python_records(frame))
+            return len(frame)
         except Exception as e:
             raise TypeError(f'[ERROR] _import_diabetes_tablet for ID {patient_id}: {e}')
 
     def _import_therapy(self, patient_id, group):
         pass
 
+    def _expand_group(self, patient_id, group):
+        """
+        one vectorized pass over a patient group instead of iterrows per table:
+        the time fields are converted once and the wide dose_* columns are melted into long
+        (patient, time, drug, dose) frames. returns {table name: frame ready for insert}.
+        """
+        times = self._time_frame(patient_id, group)
+
+        dietary_mask = np.zeros(len(group), dtype=bool)
+        if 'Dietary intake' in group.columns:
+            flags = pd.to_numeric(group['Dietary intake'].astype(str).str.strip(), errors='coerce')
+            dietary_mask = (flags == 1).to_numpy()
+
+        measurement = times.copy()
+        for source_col, target_col in self.measurement_columns.items():
+            values = group[source_col] if source_col in group.columns else pd.Series(np.nan, index=group.index)
+            measurement[target_col] = pd.to_numeric(values, errors='coerce').fillna(0.0).to_numpy()
+
+        # ts is the partition key of measurement, a row without a valid date cannot be placed in any partition
+        untimed = measurement['ts'].isna()
+        if untimed.any():
+            self.untimed_measurements += int(untimed.sum())
+            measurement = measurement[~untimed].reset_index(drop=True)
+
+        self.measurement_partitions.ensure(measurement['ts'])
+
+        insulin = self._melt_doses(times, group, self.insulin_columns)
+        tablet = self._melt_doses(times, group, self.diabetes_tablet_columns)
+
+        return {
+            DietaryIntake.__tablename__: times[dietary_mask].reset_index(drop=True),
+            Measurement.__tablename__: measurement,
+            TakingInsulin.__tablename__: self._with_dimension_ids(insulin, 'insulin_id', self.insulin_cache),
+            TakingDiabetesTablet.__tablename__: self._with_dimension_ids(tablet, 'diabetes_tablet_id',
+                                                                         self.diabetes_tablet_cache),
+        }
+
+    def _time_frame(self, patient_id, group):
+        frame = pd.DataFrame({'patient_id': str(patient_id)}, index=range(len(group)))
+        for source_col, target_col in self.time_columns.items():
+            values = group[source_col] if source_col in group.columns else pd.Series(pd.NA, index=group.index)
+            frame[target_col] = pd.to_numeric(values, errors='coerce').astype('Int64').array
+
+        # one vectorized conversion of the parts into the ts key, a missing or invalid part gives NaT -> NULL
+        frame['ts'] = pd.to_datetime(frame[list(self.time_columns.values())].astype('float64'), errors='coerce')
+        return frame
+
+    @staticmethod
+    def _melt_doses(times, group, dose_columns):
+        columns = [col for col in dose_columns if col in group.columns]
+        doses = group[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+        row_idx, col_idx = np.nonzero(doses > 0)  # row-major, same order as the old iterrows loop; NaN is skipped
+        names = np.array([DataImporter._dose_name(col) for col in columns], dtype=object)
+
+        long = times.iloc[row_idx].reset_index(drop=True)
+        long['name'] = names[col_idx]
+        long['dose'] = doses[row_idx, col_idx]
+        return long
+
+    @staticmethod
+    def _dose_name(col):
+        return col.replace("dose_", "").replace("_", " ").title()
+
+    @staticmethod
+    def _with_dimension_ids(frame, id_column, cache):
+        ids = cache.get_ids(frame['name'].unique())  # one batch per patient, new names upserted together
+        frame.insert(1, id_column, frame.pop('name').map(ids).astype('Int64'))
+        return frame
+
     def _get_or_create_partition(self, partition_name: str):
         partition = self.session.query(DatasetPartition).filter_by(name=partition_name).first()
         if not partition:
@@ -256,22 +605,32 @@ class DataImporter:
 
 
     def _get_or_create_insulin_id(self, name: str) -> int:
-        insulin = self.session.query(Insulin).filter_by(name=name).first()
+        return self.insulin_cache.get_id(name)
+
 
-        if not insulin:
-            insulin = Insulin(name=name)
-            self.session.add(insulin)
-            self.session.flush()
+    def _get_or_create_diabetes_tablet(self, name: str) -> int:
+        return self.diabetes_tablet_cache.get_id(name)
 
-        return insulin.id
+    def _report_untimed_measurements(self):
+        if self.untimed_measurements:
+            print(f'[WARNING] {self.untimed_measurements} measurement rows without a valid date not imported '
+                  f'(ts is the partition key of {Measurement.__tablename__})')
 
+    def _report_caches(self):
+        self.insulin_cache.report()
+        self.diabetes_tablet_cache.report()
 
-    def _get_or_create_diabetes_tablet(self, name: str) -> int:
-        diabetes_tablet = self.session.query(DiabetesTablets).filter_by(name=name).first()
 
-        if not diabetes_tablet:
-            diabetes_tablet = DiabetesTablets(name=name)
-            self.session.add(diabetes_tablet)
-            self.session.flush()
+_worker_importer = None
+_worker_method = None
+
+
+def _init_worker(partition_name, method):
+    # runs once per pool process: a fresh engine, never the pooled connections inherited from the parent
+    global _worker_importer, _worker_method
+    _worker_importer = DataImporter(partition_name, bind=create_engine(DATABASE_URL))
+    _worker_method = method
+
 
-        return diabetes_tablet.id
+def _import_batch(batch):
+    return _worker_importer.import_patient_batch(batch, _worker_method)
@@ -1,28 +1,26 @@
+from db.models import AdditionalDrugs, Comorbidities
 from training_model.preparing.static_embedding_encoder import StaticEmbedderEncoder
 from training_model.preparing.static_preprocessing import StaticProcessing
 from training_model.repository import Repository
 
 repo = Repository()
 
-patients = repo.get_patients_td()
+static_features = repo.get_static_features('train')  # one query, no ORM objects
 
-patient_to_drugs = repo.get_patient_drugs_map()
-patient_to_comorbities = repo.get_patient_comorbities_map()
+# one query per entity and split: embedding indices by name, 0 = padding, same vocabulary for train and test
+drug_patient_ids, drug_offsets, drug_values, unique_drugs_size = repo.get_entity_indices(AdditionalDrugs, 'train')
+comorb_patient_ids, comorb_offsets, comorb_values, unique_comorbities_size = repo.get_entity_indices(
+    Comorbidities, 'train')
 
-unique_drugs = StaticProcessing.get_unique_entities(list(patient_to_drugs.values()))
-unique_comorbities = StaticProcessing.get_unique_entities(list(patient_to_comorbities.values()))
+# rows of the padded arrays in the order of static_features
+drug_indices = StaticProcessing.align_indices(drug_patient_ids, drug_offsets, drug_values, static_features.index)
+comorb_indices = StaticProcessing.align_indices(comorb_patient_ids, comorb_offsets, comorb_values,
+                                                static_features.index)
 
-static_tensor, drug_indices, comorb_indices = StaticProcessing.get_static_tensor_with_embeddings(
-    patients,
-    unique_drugs,
-    unique_comorbities,
-    patient_to_drugs,
-    patient_to_comorbities)
+static_tensor = StaticProcessing.get_static_tensor(static_features)
 
 # creating a static data encoder model
 static_dim = static_tensor.shape[1]  # static_tensor.shape = (e.g. 128, 9) → 128 patients, each with 9 features
-unique_drugs_size = len(unique_drugs)
-unique_comorbities_size = len(unique_comorbities)
 emb_dim = 32  # 32 - is default
 hidden_dim = 64
 
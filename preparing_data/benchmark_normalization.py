@@ -0,0 +1,172 @@
+"""
+times the DfFullData normalizers against the implementations they replaced, on the full Shanghai
+time-series merge, and checks that both give the same columns.
+
+run from preparing_data/: python benchmark_normalization.py [folder of the Shanghai CSV data]
+"""
+import re
+import sys
+import time
+
+import pandas as pd
+
+from df_full_data import DfFullData
+
+DEFAULT_FOLDER = '../full_data/Shanghai_diabetes_datasets/Shanghai_CSV-Data'
+
+
+def legacy_insulin_dose_sc(column, normalization_map):
+    """
+    the previous implementation: one .apply per medicament, every cell re-split for each of them.
+    aliases of one column (e.g. 'insulin glarigine') overwrite each other here in set order,
+    so dose_insulin_glargine can legitimately differ when the data contains such aliases.
+    """
+    medicaments = set()
+    for values in column.dropna():
+        for part in values.split(';'):
+            match = re.match(r'\s*(.*?),\s*\d+\s*IU', part.strip())
+            if match:
+                medicaments.add(match.group(1).strip())
+
+    doses = pd.DataFrame(index=column.index)
+    for medicament in medicaments:
+        norm_med = normalization_map.get(medicament.strip(),
+                                         medicament.strip().lower().replace(" ", "_").replace("-", "_"))
+        doses[f'dose_{norm_med}'] = column.apply(
+            lambda x: sum(
+                int(part.strip().split(',')[1].strip().split()[0])
+                for part in x.split(';')
+                if part.strip().lower().startswith(medicament.lower())
+            ) if pd.notna(x) else 0
+        )
+    return doses
+
+
+def legacy_insulin_dose_iv(column):
+    """the previous implementation: one re.finditer scan of the whole column per insulin name"""
+    insulin_names = set()
+    for text in column.dropna():
+        for dose, name in re.findall(r'(\d+)\s*IU\s+([A-Za-z][A-Za-z\s\d\-]*)', text):
+            insulin_names.add(name.strip())
+
+    doses = pd.DataFrame(index=column.index)
+    for medicament in insulin_names:
+        col_name = f'dose_{medicament.strip().lower().replace(" ", "_").replace("-", "_")}'
+        new_values = column.apply(
+            lambda x: sum(
+                int(match.group(1))
+                for match in re.finditer(rf'(\d+)\s*IU\s+{re.escape(medicament)}', x, re.IGNORECASE)
+            ) if pd.notna(x) else 0
+        )
+        doses[col_name] = doses.get(col_name, pd.Series(0, index=column.index)) + new_values
+    return doses
+
+
+NON_INSULIN_PATTERN = r'([a-z\d_\- ]+?)\s+((?:\d+(?:\.\d+)?\s*(?:mg|g))(?:\s*/\s*\d+(?:\.\d+)?\s*(?:mg|g))?)'
+
+
+def legacy_non_insulin_agents(column):
+    """
+    the previous implementation, parser included: one scan collecting the substances, then iterrows
+    re-parsing every cell with its own regex and one .at write per dose
+    """
+    def dose_to_mg(dose_str: str) -> float:
+        match = re.match(r'(\d+(?:\.\d+)?)\s*(mg|g)', dose_str.strip())
+        if not match:
+            return 0.0
+        value, unit = float(match.group(1)), match.group(2).lower()
+
+        if unit == 'g':
+            return value * 1000
+        return value
+
+    unique_values = set()
+
+    for values in column.dropna():
+        for part in [part.strip() for part in values.split(',')]:
+            part_clean = part.lower().replace(" tablets", "").replace("/", "_").strip()
+            match = re.match(NON_INSULIN_PATTERN, part_clean)
+
+            if match:
+                unique_values.add((match.group(1).strip(), match.group(2).strip()))
+
+    frame = column.to_frame()
+    doses = pd.DataFrame(index=column.index)
+    for substance, _ in unique_values:
+        col_name = f'dose_{substance.replace(" ", "_")}'
+        if col_name not in doses.columns:
+            doses[col_name] = 0.0
+
+    def parse_and_sum_doses(cell_value):
+        result = {}
+        if pd.isna(cell_value):
+            return result
+
+        parts = [part.strip() for part in cell_value.lower().replace(" tablets", "").replace("/", "_").split(',')]
+        for part in parts:
+            match = re.match(NON_INSULIN_PATTERN, part)
+
+            if not match:
+                continue
+
+            substance = match.group(1).strip()
+            dose_parts = [d.strip() for d in match.group(2).strip().split('/')]
+
+            result[substance] = result.get(substance, 0) + sum(dose_to_mg(d) for d in dose_parts)
+        return result
+
+    for idx, row in frame.iterrows():
+        for substance, dose_val in parse_and_sum_doses(row[column.name]).items():
+            col_name = f'dose_{substance.replace(" ", "_")}'
+            if col_name in doses.columns:
+                doses.at[idx, col_name] += dose_val
+    return doses
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def _compare(name, legacy, current):
+    legacy_result, legacy_seconds = legacy
+    current_result, current_seconds = current
+
+    differing = [col for col in sorted(set(legacy_result.columns) | set(current_result.columns))
+                 if col not in legacy_result or col not in current_result
+                 or not (legacy_result[col] == current_result[col]).all()]
+
+    print(f'{name}: legacy {legacy_seconds:.2f}s, current {current_seconds:.2f}s '
+          f'({legacy_seconds / current_seconds if current_seconds else float("inf"):.1f}x), '
+          f'differing columns: {differing or "none"}')
+
+
+def main(folder_path=DEFAULT_FOLDER):
+    df = DfFullData(folder_path).df
+    print(f'merged frame: {df.shape[0]} rows')
+
+    column = df['Insulin dose - s.c.']
+    _compare(
+        'insulin dose s.c.',
+        _timed(legacy_insulin_dose_sc, column, DfFullData.SC_NORMALIZATION_MAP),
+        _timed(DfFullData.parse_insulin_dose_sc, column, DfFullData.SC_NORMALIZATION_MAP),
+    )
+
+    column = df['Insulin dose - i.v.']
+    _compare(
+        'insulin dose i.v.',
+        _timed(legacy_insulin_dose_iv, column),
+        _timed(DfFullData.parse_insulin_dose_iv, column),
+    )
+
+    column = df['Non-insulin hypoglycemic agents']
+    _compare(
+        'non-insulin agents',
+        _timed(legacy_non_insulin_agents, column),
+        _timed(DfFullData.parse_non_insulin_column, column),
+    )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
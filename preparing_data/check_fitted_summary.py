@@ -0,0 +1,50 @@
+"""
+checks FittedSummaryPreprocessor on the input it exists for: fits on the full summary cohort, then transforms
+one new patient without other agents and comorbidities - read back with pd.read_csv, so the empty fields are
+float64 NaN columns - and checks that the row keeps the fitted columns with all drug / disease flags at zero.
+
+run from preparing_data/: python check_fitted_summary.py [folder of the Shanghai summary CSV files]
+"""
+import io
+import sys
+
+import pandas as pd
+
+from df_shanghai_summary import SUMMARY_FOLDER, DiabetesDataPreprocessor, FittedSummaryPreprocessor
+
+
+def new_patient(folder_path):
+    """first summary row without other agents and comorbidities, as pd.read_csv reads such a file"""
+    row = DiabetesDataPreprocessor(folder_path).load_and_combine_data().get_data().iloc[[0]]
+    row = row.assign(**{'Other Agents': None, 'Comorbidities': None})
+    return pd.read_csv(io.StringIO(row.to_csv(index=False)))
+
+
+def main(folder_path=SUMMARY_FOLDER):
+    fitted = FittedSummaryPreprocessor()
+    cohort = fitted.fit(folder_path)
+    print(f'fitted on {len(cohort)} patients, {len(fitted.columns)} columns')
+
+    patient = new_patient(folder_path)
+    processed = fitted.transform(patient)
+
+    group_flags = [f'has_{group}' for index in (fitted.drug_index, fitted.disease_index)
+                   for group in sorted(set(index.groups.values()))]
+
+    problems = []
+    if len(processed) != 1:
+        problems.append(f'{len(processed)} rows instead of 1')
+    if list(processed.columns) != fitted.columns:
+        problems.append(f'columns differ from the fitted ones: {sorted(set(processed.columns) ^ set(fitted.columns))}')
+    flagged = [col for col in group_flags if col not in processed or processed[col].ne(0).any()]
+    if flagged:
+        problems.append(f'group flags missing or set without agents: {flagged}')
+
+    if problems:
+        raise ValueError('FittedSummaryPreprocessor.transform on one new patient: ' + '; '.join(problems))
+
+    print(f'one new patient without agents: {processed.shape[1]} fitted columns, {len(group_flags)} group flags at 0')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,23 +1,72 @@
 import re
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
-from df_shanghai_summary import main
+from df_shanghai_summary import main, summary_cache_key
+from dtype_optimizer import optimize_dtypes
 from df_shanghai_time_series import DfShanghaiTimeSeries
+from parse_cache import ParseCache
+from sequence_corpus import write_sequence_corpus
+from stage_cache import CACHE_DIR, StageCache, densify
 
 
 class DfFullData:
-    def __init__(self, folder_path):
+    parse_cache = ParseCache(maxsize=4096)  # shared by all normalizers (and instances), see ParseCache
+
+    MERGE_VERSION = 1  # bump when _merge_sources changes - invalidates its cached artifacts
+
+    def __init__(self, folder_path, cache_dir=CACHE_DIR / 'shanghai', cache_max_bytes=2 * 1024 ** 3,
+                 sparse_doses=False):
         self.df = None
+        self.merged_df = None  # merged, not yet normalized frame - loaded once per instance
         self.folder_path = Path(folder_path)
-        self._load_and_merge_final_data()
+        self.cache = StageCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.sparse_doses = sparse_doses  # dose_* columns as SparseDtype (fill 0), see _dose_frame
+
+    @property
+    def df(self):
+        # loaded on first use: normalize_all can skip the load and the merge entirely when its artifacts hit
+        if self._df is None:
+            self._load_and_merge_final_data()
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        self._df = value
 
     def _load_and_merge_final_data(self):
-        merger = DfShanghaiTimeSeries(self.folder_path)
+        """
+        merged time series + summary frame, kept in self.merged_df. with a cache_dir the summary,
+        the time series and the merge are stage artifacts (see StageCache) and only rerun when their
+        input csv files or code version changed.
+        """
+        self.df = self._merged()
+        return self.merged_df
+
+    def _merged(self):
+        if self.merged_df is None:
+            if self.cache is not None:
+                self.merged_df = self.cache.cached(self._merged_key(), self._merge_sources)
+            else:
+                self.merged_df = self._merge_sources()
+
+        return self.merged_df
+
+    def _merged_key(self):
+        return self.cache.key(
+            'merged', self.MERGE_VERSION,
+            DfShanghaiTimeSeries(self.folder_path).cache_key(self.cache),
+            summary_cache_key(self.cache),
+        )
+
+    def _merge_sources(self):
+        merger = DfShanghaiTimeSeries(self.folder_path, cache=self.cache)
         merger_df = merger.merge_all_data_ts()
 
-        summary_df = main()
+        summary_df = main(cache=self.cache)
 
         summary_ids = set(summary_df['Patient Number'].unique())
         merger_df = merger_df[merger_df['Patient Number'].isin(summary_ids)]
@@ -33,118 +82,236 @@ class DfFullData:
 
         merger_df = merger_df.drop(columns=['Date'])
 
-        first_cols = ['Patient Number', 'year_treat', 'month_treat', 'day_treat', 'hour_of_day_treat', 'minute_treat']
+        first_cols = ['Patient Number'] + self.TIME_COLUMNS
         others_cols = [col for col in merger_df.columns if col not in first_cols]
         merger_df = merger_df[first_cols + others_cols]
         extra_ids = set(merger_df['Patient Number'].unique()) - summary_ids
 
         if extra_ids: print('Extra IDs (in merger_df but not in summary_df):', extra_ids)
 
-        self.df = merger_df
         return merger_df
 
-    def process_col(self, name_col, match_pattern, split_by):
-        unique_values = set()
-
-        for values in self._load_and_merge_final_data()[name_col].dropna():
-            parts = values.split(split_by)
-
-            for part in parts:
-                match = re.match(match_pattern, part.strip())
+    SC_DOSE_PATTERN = r'^\s*(.*?),\s*(\d+)\s*IU'  # "insulin degludec, 12 IU" -> ("insulin degludec", "12")
+
+    SC_NORMALIZATION_MAP = {
+        'insulin\xa0glargine': 'insulin_glargine',
+        'insulin glarigine': 'insulin_glargine',
+        'insulin glargine': 'insulin_glargine',
+        'insulin detemir': 'insulin_detemir',
+        'insulin degludec': 'insulin_degludec',
+        'insulin aspart': 'insulin_aspart',
+        'insulin aspart 70/30': 'insulin_aspart_70_30',
+        'insulin glulisine': 'insulin_glulisine',
+        'SciLin M30': 'scilin_m30',
+        'Humulin R': 'humulin_r',
+        'Humulin 70/30': 'humulin_70_30',
+        'Novolin 30R': 'novolin_30r',
+        'Novolin 50R': 'novolin_50r',
+        'Novolin R': 'novolin_r',
+        'Gansulin R': 'gansulin_r',
+        'Gansulin 40R': 'gansulin_40r',
+    }
+
+    @staticmethod
+    def parse_insulin_dose_sc_values(values):
+        """
+        single pass over distinct 'Insulin dose - s.c.' strings (positional index):
+
+        ➤ "Humulin R, 2 IU; insulin degludec, 12 IU" → split(';') + explode → one row per part:
+          (0, "Humulin R, 2 IU"), (0, "insulin degludec, 12 IU")
+
+        ➤ str.extract(SC_DOSE_PATTERN) → (0, "Humulin R", 2), (0, "insulin degludec", 12)
+
+        returns per value ((name, IU), ...), (unmatched parts)
+        """
+        parts = values.str.split(';').explode().str.strip()
+        parsed = parts.str.extract(DfFullData.SC_DOSE_PATTERN)
+        matched = parsed[0].notna().to_numpy()
+        rows = parts.index.to_numpy()
+
+        return DfFullData._per_value(
+            len(values),
+            rows[matched], parsed[0].str.strip().to_numpy()[matched], parsed[1].to_numpy()[matched],
+            rows[~matched], parts.to_numpy()[~matched],
+        )
+
+    @staticmethod
+    def parse_insulin_dose_sc(column, normalization_map, cache=None):
+        """
+        'Insulin dose - s.c.' → DataFrame (same index as column) with one int dose_* column per medicament found.
+
+        ➤ the column is factorized and its distinct strings not in the shared parse cache go through
+          parse_insulin_dose_sc_values in one pass: "Humulin R, 2 IU; insulin degludec, 12 IU"
+          → (("Humulin R", 2), ("insulin degludec", 12))
+
+        ➤ medicament names → dose_* columns are resolved on the few unique names only. as before, a part
+          counts for every medicament its name starts with (case-insensitive), e.g. "insulin aspart 70/30"
+          also counts for dose_insulin_aspart; names that normalize to the same column are summed.
+
+        ➤ doses are pivoted per distinct string and every row takes the row of its code
+        """
+        cache = DfFullData.parse_cache if cache is None else cache
+        codes, parsed = cache.parse_column(column, DfFullData.parse_insulin_dose_sc_values, vectorized=True)
+
+        for _, missed in parsed:
+            for part in missed:
+                print(f'missed matches in column: {column.name}', part)
+
+        names = dict.fromkeys(name for pairs, _ in parsed for name, _ in pairs)  # first-appearance order
+        columns = {
+            medicament: 'dose_' + normalization_map.get(
+                medicament, medicament.lower().replace(" ", "_").replace("-", "_"))
+            for medicament in names
+        }
 
-                if match:
-                    unique_values.add(match.group(1).strip())
-                else:
-                    print(f'missed matches in column: {name_col}', part)
+        return DfFullData._doses_by_code(parsed, columns, codes, column.index)
+
+    IV_DOSE_PATTERN = r'(\d+)\s*IU\s+([A-Za-z][A-Za-z\s\d\-]*)'  # "..., 12 IU Novolin R, ..." -> ("12", "Novolin R")
+
+    @staticmethod
+    def parse_insulin_dose_iv_values(values):
+        """
+        single pass over distinct 'Insulin dose - i.v.' strings: str.extractall with one pattern finds every
+        "<N> IU <name>" fragment, e.g. "500ml 0.9% sodium chloride, 12 IU Novolin R, 10 ml KCl" → (("Novolin R", 12),).
+        the raw name may carry trailing spaces - only used for prefix matching.
+        """
+        matches = values.str.extractall(DfFullData.IV_DOSE_PATTERN)  # index: (value position, match number)
+
+        return DfFullData._per_value(
+            len(values), matches.index.get_level_values(0), matches[1].to_numpy(), matches[0].to_numpy())
+
+    @staticmethod
+    def _per_value(count, rows, names, doses, missed_rows=(), missed_parts=()):
+        """long (value position, name, dose) arrays → per value ((name, int dose), ...), (unmatched parts)"""
+        pairs = [[] for _ in range(count)]
+        for row, name, dose in zip(rows, names, doses):
+            pairs[row].append((name, int(dose)))
+
+        missed = [[] for _ in range(count)]
+        for row, part in zip(missed_rows, missed_parts):
+            missed[row].append(part)
+
+        return [(tuple(value_pairs), tuple(value_missed)) for value_pairs, value_missed in zip(pairs, missed)]
+
+    @staticmethod
+    def parse_insulin_dose_iv(column, cache=None):
+        """
+        'Insulin dose - i.v.' → dose_* frame like parse_insulin_dose_sc: the uncached distinct strings go through
+        parse_insulin_dose_iv_values in one pass and the fragments are summed per row and dose_* column.
+        """
+        cache = DfFullData.parse_cache if cache is None else cache
+        codes, parsed = cache.parse_column(column, DfFullData.parse_insulin_dose_iv_values, vectorized=True)
+
+        names = dict.fromkeys(name.strip() for pairs, _ in parsed for name, _ in pairs)
+        columns = {
+            medicament: 'dose_' + medicament.lower().replace(" ", "_").replace("-", "_")
+            for medicament in names
+        }
 
-        return unique_values
+        return DfFullData._doses_by_code(parsed, columns, codes, column.index)
+
+    @staticmethod
+    def _doses_by_code(parsed, columns, codes, index):
+        """
+        parsed (pairs, missed) per unique + factorize codes → wide int dose frame over index.
+        the pivot runs on the uniques; a trailing all-zero row is what code -1 (empty cell) picks up.
+        """
+        long = pd.DataFrame(
+            [(code, name, dose) for code, (pairs, _) in enumerate(parsed) for name, dose in pairs],
+            columns=['row', 'name', 'dose'],
+        )
+
+        by_unique = DfFullData._pivot_doses(long, columns, pd.RangeIndex(len(parsed) + 1))
+
+        return pd.DataFrame(by_unique.to_numpy()[codes], index=index, columns=by_unique.columns)
+
+    @staticmethod
+    def _pivot_doses(long, columns, index):
+        """
+        long (row position, name, dose) frame + {medicament: dose column} → wide int frame over index.
+
+        a name counts for every medicament it starts with (case-insensitive), as the old per-medicament
+        startswith / regex scans did; this is resolved once on the unique names, never per row.
+        """
+        names = long['name'].unique()
+
+        name_to_column = pd.DataFrame(
+            [(name, col) for medicament, col in columns.items()
+             for name in names if name.lower().startswith(medicament.lower())],
+            columns=['name', 'column'],
+        ).drop_duplicates()
+
+        doses = (
+            long.merge(name_to_column, on='name')
+            .groupby(['row', 'column'])['dose'].sum()
+            .unstack(fill_value=0)
+            .reindex(index=np.arange(len(index)), columns=list(dict.fromkeys(columns.values())), fill_value=0)
+            .fillna(0)
+            .astype('int64')
+        )
+        doses.index = index
+        doses.columns.name = None
+
+        return doses
+
+    def _dose_frame(self, doses):
+        """
+        with sparse_doses the dose_* frame (or series) is stored as SparseDtype with fill value 0: only the few
+        given doses are kept, so the frame and every copy the following normalizers make shrink by the fill ratio.
+        """
+        if not self.sparse_doses:
+            return doses
 
-    def __normalize_insulin_dose_sc(self):
+        if isinstance(doses, pd.Series):
+            return doses if isinstance(doses.dtype, pd.SparseDtype) else doses.astype(pd.SparseDtype(doses.dtype, 0))
 
-        insulin_dose_sc = self.process_col('Insulin dose - s.c.', r'\s*(.*?),\s*\d+\s*IU', ';')
-
-        med_normalization_map = {
-            'insulin\xa0glargine': 'insulin_glargine',
-            'insulin glarigine': 'insulin_glargine',
-            'insulin glargine': 'insulin_glargine',
-            'insulin detemir': 'insulin_detemir',
-            'insulin degludec': 'insulin_degludec',
-            'insulin aspart': 'insulin_aspart',
-            'insulin aspart 70/30': 'insulin_aspart_70_30',
-            'insulin glulisine': 'insulin_glulisine',
-            'SciLin M30': 'scilin_m30',
-            'Humulin R': 'humulin_r',
-            'Humulin 70/30': 'humulin_70_30',
-            'Novolin 30R': 'novolin_30r',
-            'Novolin 50R': 'novolin_50r',
-            'Novolin R': 'novolin_r',
-            'Gansulin R': 'gansulin_r',
-            'Gansulin 40R': 'gansulin_40r',
-        }
+        return doses.astype({col: pd.SparseDtype(dtype, 0) for col, dtype in doses.dtypes.items()
+                             if not isinstance(dtype, pd.SparseDtype)})
 
-        for medicament in insulin_dose_sc:
-            norm_med = med_normalization_map.get(medicament.strip(),
-                                                 medicament.strip().lower().replace(" ", "_").replace("-", "_"))
-            col_name = f'dose_{norm_med}'
-            """
-            ➤ Suppose x is "Humulin R, 2 IU; insulin degludec, 12 IU". medicament - "insulin degludec"
-            
-            ➤ x.split(‘;’) - ["Humulin R, 2 IU", " insulin degludec, 12 IU"]
-            
-            ➤ for part in x.split(‘;’) - first "Humulin R, 2 IU" and then " insulin degludec, 12 IU"
-            
-            ➤ if part.strip().lower().startswith(medicament.lower()) - If part of the string starts with the name of the medicine (medicament) - ignoring spaces and case - then process that part. " insulin degludec, 12 IU" - it starts with "insulin degludec".
-            
-            ➤ part.strip().split(‘,’)[1]: → "insulin degludec, 12 IU" → split(‘,’) → ["insulin degludec", " 12 IU"] → Take [1] → " 12 IU"
-            
-            ➤ .strip().split()[0] → " 12 IU" → .strip() → "12 IU" → .split() → ["12", "IU"] → Take [0] → "12"
-            
-            ➤ int(...)→ Convert "12" → 12 (int type)
-            """
-            self.df[col_name] = self.df['Insulin dose - s.c.'].apply(
-                lambda x: sum(
-                    int(part.strip().split(',')[1].strip().split()[0])
-                    for part in x.split(';')
-                    if part.strip().lower().startswith(medicament.lower())
-                ) if pd.notna(x) else 0
-            )
-        self.df = self.df.drop(columns=['Insulin dose - s.c.'], axis=1)
+    @staticmethod
+    def dose_columns(frame):
+        return [col for col in frame.columns if col.startswith('dose_')]
 
-        return self
+    def dose_matrix(self):
+        """dose_* columns as a scipy CSR matrix (rows of self.df) and their names, for building model batches"""
+        columns = self.dose_columns(self.df)
+        doses = self.df[columns]
 
-    def __normalize_insulin_dose_iv(self):
-        insulin_names = set()
+        if all(isinstance(dtype, pd.SparseDtype) for dtype in doses.dtypes):
+            return doses.sparse.to_coo().tocsr(), columns
 
-        for text in self.df[
-            'Insulin dose - i.v.'].dropna():  # search all rows from the ‘Insulin dose - i.v.’ column that are not empty
-            matches = re.findall(r'(\d+)\s*IU\s+([A-Za-z][A-Za-z\s\d\-]*)',
-                                 text)  # regular expression that searches for fragments of the following type: 12 IU Novolin R
+        return sparse.csr_matrix(doses.to_numpy(dtype='float64')), columns
 
-            # In each line, look for all fragments that match the pattern (number + IU + name)
-            # For example, if the string is: 500ml 0.9% sodium chloride, 12 IU Novolin R, 10 ml KCl The matches would be: [(‘12’, ‘Novolin R’)].
+    def __normalize_insulin_dose_sc(self):
+        doses = self._dose_frame(self.parse_insulin_dose_sc(self.df['Insulin dose - s.c.'], self.SC_NORMALIZATION_MAP))
 
-            for dose, name in matches:
-                insulin_names.add(name.strip())
-                # Add the found insulin name (e.g. Novolin R) to the insulin_names set.
+        self.df = self.df.assign(**doses)
+        self.df = self.df.drop(columns=['Insulin dose - s.c.'], axis=1)
 
-        for medicament in insulin_names:
-            norm_med = medicament.strip().lower().replace(" ", "_").replace("-", "_")
-            col_name = f'dose_{norm_med}'
+        return self
 
-            new_values = self.df['Insulin dose - i.v.'].apply(
-                lambda x: sum(
-                    int(match.group(1))
-                    for match in re.finditer(rf'(\d+)\s*IU\s+{re.escape(medicament)}', x, re.IGNORECASE)
-                ) if pd.notna(x) else 0
-            )
+    def __normalize_insulin_dose_iv(self):
+        doses = self._dose_frame(self.parse_insulin_dose_iv(self.df['Insulin dose - i.v.']))
 
-            existing_col = self.df.get(col_name, pd.Series(0, index=self.df.index))
-            self.df[col_name] = existing_col + new_values
+        # i.v. doses add up with the s.c. ones of the same insulin - one block addition for the shared columns
+        existing = [col for col in doses.columns if col in self.df.columns]
+        if existing:
+            doses[existing] = doses[existing] + self.df[existing]
 
+        self.df = self.df.assign(**doses)
         self.df = self.df.drop(columns=['Insulin dose - i.v.'], axis=1)
 
         return self
 
+    @staticmethod
+    def parse_csii_dose(value):
+        if isinstance(value, str) and "temporarily suspend insulin delivery" in value.lower():
+            return 0.0
+        try:
+            return float(value)
+        except:
+            return 0.0
+
     def __normalize_csii_dose_insulin(self):
         cols = [
             'CSII - bolus insulin (Novolin R, IU)',
@@ -152,25 +319,26 @@ class DfFullData:
         ]
 
         for col in cols:
-            def extract_dose(value):
-                if isinstance(value, str) and "temporarily suspend insulin delivery" in value.lower():
-                    return 0
-                try:
-                    return float(value)
-                except:
-                    return 0
-
             existing = self.df.get('dose_novolin_r', pd.Series(0, index=self.df.index)).fillna(0)
 
-            doses = self.df[col].apply(extract_dose).fillna(0)
-            existing = existing + doses
+            codes, parsed = self.parse_cache.parse_column(self.df[col], self.parse_csii_dose)
+            doses = pd.Series(np.append(parsed, 0.0)[codes], index=self.df.index).fillna(0)  # code -1 → 0
+            existing = self._dose_frame(existing + self._dose_frame(doses))
 
             self.df['dose_novolin_r'] = existing
             self.df = self.df.drop(columns=[col], axis=1)
 
         return self
 
-    def __normalize_non_insulin_agents(self):
+    NON_INSULIN_PATTERN = re.compile(
+        r'([a-z\d_\- ]+?)\s+((?:\d+(?:\.\d+)?\s*(?:mg|g))(?:\s*/\s*\d+(?:\.\d+)?\s*(?:mg|g))?)')
+
+    @staticmethod
+    def parse_non_insulin_agents(cell_value):
+        """
+        "metformin 500 mg, acarbose 50 mg tablets" → ({'metformin': 500.0, 'acarbose': 50.0}, [unmatched parts])
+        doses are converted to mg and summed per substance.
+        """
         def dose_to_mg(dose_str: str) -> float:
             match = re.match(r'(\d+(?:\.\d+)?)\s*(mg|g)', dose_str.strip())
             if not match:
@@ -181,56 +349,63 @@ class DfFullData:
                 return value * 1000
             return value
 
-        unique_values = set()
-
-        for values in self.df['Non-insulin hypoglycemic agents'].dropna():
-            parts = [part.strip() for part in values.split(',')]
-
-            for part in parts:
-                part_clean = part.lower().replace(" tablets", "").replace("/", "_").strip()
-                match = re.match(
-                    r'([a-z\d_\- ]+?)\s+((?:\d+(?:\.\d+)?\s*(?:mg|g))(?:\s*/\s*\d+(?:\.\d+)?\s*(?:mg|g))?)', part_clean)
-
-                if match:
-                    substance = match.group(1).strip()
-                    dose_str = match.group(2).strip()
-                    unique_values.add((substance, dose_str))
-                else:
-                    print(f"missed matches in column: 'Non-insulin hypoglycemic agents'", part)
+        doses = {}
+        missed = []
 
-        for substance, _ in unique_values:
-            col_name = f'dose_{substance.replace(" ", "_")}'
-            if col_name not in self.df.columns:
-                self.df[col_name] = 0.0
+        parts = [part.strip() for part in cell_value.lower().replace(" tablets", "").replace("/", "_").split(',')]
+        for part in parts:
+            match = DfFullData.NON_INSULIN_PATTERN.match(part)
 
-        def parse_and_sum_doses(cell_value):
-            doses = {}
-            if pd.isna(cell_value):
-                return doses
-
-            parts = [part.strip() for part in cell_value.lower().replace(" tablets", "").replace("/", "_").split(',')]
-            for part in parts:
-                match = re.match(
-                    r'([a-z\d_\- ]+?)\s+((?:\d+(?:\.\d+)?\s*(?:mg|g))(?:\s*/\s*\d+(?:\.\d+)?\s*(?:mg|g))?)', part)
+            if not match:
+                missed.append(part)
+                continue
+
+            substance = match.group(1).strip()
+            dose_str = match.group(2).strip()
+
+            dose_parts = [d.strip() for d in dose_str.split('/')]
+            dose_mg_total = sum(dose_to_mg(d) for d in dose_parts)
+
+            doses[substance] = doses.get(substance, 0) + dose_mg_total
+
+        return doses, missed
+
+    @staticmethod
+    def parse_non_insulin_column(column, cache=None):
+        """
+        the column repeats a handful of prescriptions over thousands of rows: every distinct string is parsed
+        once (through the shared parse cache), the parsed doses form a (uniques × dose_*) matrix and each row
+        takes the matrix row of its code. runtime scales with the number of distinct prescriptions, not with rows.
+        """
+        cache = DfFullData.parse_cache if cache is None else cache
+        codes, results = cache.parse_column(column, DfFullData.parse_non_insulin_agents)  # NaN → code -1
+
+        parsed = []
+        for doses, missed in results:
+            for part in missed:
+                print(f"missed matches in column: 'Non-insulin hypoglycemic agents'", part)
+            parsed.append(doses)
+
+        columns = list(dict.fromkeys(
+            f'dose_{substance.replace(" ", "_")}' for doses in parsed for substance in doses))
+        positions = {col: i for i, col in enumerate(columns)}
+
+        # one extra all-zero row at the end: code -1 (empty cell) indexes it
+        matrix = np.zeros((len(parsed) + 1, len(columns)))
+        for code, doses in enumerate(parsed):
+            for substance, dose_val in doses.items():
+                matrix[code, positions[f'dose_{substance.replace(" ", "_")}']] += dose_val
 
-                if not match:
-                    continue
+        return pd.DataFrame(matrix[codes], index=column.index, columns=columns)
 
-                substance = match.group(1).strip()
-                dose_str = match.group(2).strip()
+    def __normalize_non_insulin_agents(self):
+        doses = self._dose_frame(self.parse_non_insulin_column(self.df['Non-insulin hypoglycemic agents']))
 
-                dose_parts = [d.strip() for d in dose_str.split('/')]
-                dose_mg_total = sum(dose_to_mg(d) for d in dose_parts)
+        existing = [col for col in doses.columns if col in self.df.columns]
+        if existing:
+            doses[existing] = doses[existing] + self.df[existing]
 
-                doses[substance] = doses.get(substance, 0) + dose_mg_total
-            return doses
-
-        for idx, row in self.df.iterrows():
-            doses = parse_and_sum_doses(row['Non-insulin hypoglycemic agents'])
-            for substance, dose_val in doses.items():
-                col_name = f'dose_{substance.replace(" ", "_")}'
-                if col_name in self.df.columns:
-                    self.df.at[idx, col_name] += dose_val
+        self.df = self.df.assign(**doses)
         self.df = self.df.drop(columns=['Non-insulin hypoglycemic agents'], axis=1)
 
         return self
@@ -247,10 +422,95 @@ class DfFullData:
 
         return self
 
+    TIME_COLUMNS = ['year_treat', 'month_treat', 'day_treat', 'hour_of_day_treat', 'minute_treat']
+
+    def optimize_dtypes(self, report=True):
+        """
+        smaller dtypes for the (normalized) frame, see dtype_optimizer.optimize_dtypes: patient ids as category,
+        time parts as small (nullable) ints, has_* flags as int8, measurements and dense doses as float32.
+        """
+        self.df = optimize_dtypes(self.df, categorical=['Patient Number'], integer=self.TIME_COLUMNS, report=report)
+        return self
+
+    def export_parquet(self, path, splits=None, compression='zstd'):
+        """
+        writes self.df as a hive-partitioned parquet dataset for the loaders and the training code:
+        split=<name>/ directories with splits ({split name: patient ids}, patients in no split are left out),
+        otherwise one "Patient Number=<id>"/ directory per patient. a previous export of the same partitions
+        is replaced.
+
+        rows stay grouped by patient in time order. repeated text (patient ids, prescriptions) is
+        dictionary-encoded and the long zero runs of the dose_* columns run-length encode to a few bytes
+        per page, so the mostly-zero columns cost almost nothing on disk while staying dense in memory.
+        readers pick columns and filter on the partition column (split / Patient Number) without touching the rest.
+        """
+        frame = self.df
+
+        if splits is not None:
+            split_of = {patient_id: name for name, patient_ids in splits.items() for patient_id in patient_ids}
+            frame = frame.assign(split=frame['Patient Number'].map(split_of))
+
+            unassigned = frame['split'].isna()
+            if unassigned.any():
+                print(f'{frame.loc[unassigned, "Patient Number"].nunique()} patients without a split not exported')
+                frame = frame[~unassigned]
+
+            partition_cols = ['split']
+        else:
+            partition_cols = ['Patient Number']
+
+        frame = frame.sort_values('Patient Number', kind='stable')  # keeps the time order within a patient
+
+        densify(frame).to_parquet(path, partition_cols=partition_cols, compression=compression, index=False,
+                         existing_data_behavior='delete_matching')
+
+        print(f'exported {len(frame)} rows to {path} (partitioned by {partition_cols[0]})')
+        return path
+
+    def export_sequence_corpus(self, path, static_columns, sequence_columns=None):
+        """
+        writes self.df as memory-mappable .npy sequences, static features and dose targets
+        (see sequence_corpus.write_sequence_corpus), read by SequenceCorpusDataset (training_model/preparing/sequence_corpus_dataset.py).
+        """
+        return write_sequence_corpus(self.df, path, static_columns, sequence_columns)
+
+    def __report_parse_cache(self):
+        self.parse_cache.report()
+        return self
+
     def normalize_all(self):
-        return (self
-                .__normalize_insulin_dose_sc()
-                .__normalize_insulin_dose_iv()
-                .__normalize_csii_dose_insulin()
-                .__normalize_non_insulin_agents()
-                .__fill_missing_values())
+        # (stage name, version, step, checkpoint) - bump a version when that step changes, later steps are redone
+        # with it. only checkpoint steps write an artifact: the normalizers are one pass over distinct values each,
+        # cheaper to redo than to write and read the whole frame, so only the normalized result is stored
+        steps = [
+            ('normalize_insulin_dose_sc', 1, self.__normalize_insulin_dose_sc, False),
+            ('normalize_insulin_dose_iv', 1, self.__normalize_insulin_dose_iv, False),
+            ('normalize_csii_dose_insulin', 1, self.__normalize_csii_dose_insulin, False),
+            ('normalize_non_insulin_agents', 1, self.__normalize_non_insulin_agents, False),
+            ('fill_missing_values', 1, self.__fill_missing_values, True),
+        ]
+
+        # artifacts are only valid for the merged frame - a df changed by the caller is normalized uncached
+        if self.cache is None or (self._df is not None and self._df is not self.merged_df):
+            for _, _, step, _ in steps:
+                step()
+            return self.__report_parse_cache()
+
+        keys, key = [], self._merged_key()
+        for stage, version, _, _ in steps:
+            key = self.cache.key(stage, version, key)
+            keys.append(key)
+
+        # resume after the last checkpoint with an artifact - the steps before it, and the merge, are not even loaded
+        start = next((i + 1 for i in reversed(range(len(keys))) if steps[i][3] and self.cache.has(keys[i])), 0)
+        if start:
+            # artifacts hold dense columns (parquet has no sparse type)
+            loaded = self.cache.load(keys[start - 1])
+            self.df = loaded.assign(**self._dose_frame(loaded[self.dose_columns(loaded)]))
+
+        for (_, _, step, checkpoint), key in zip(steps[start:], keys[start:]):
+            step()
+            if checkpoint:
+                self.df = self.cache.store(key, self.df)
+
+        return self.__report_parse_cache()
@@ -1,14 +1,55 @@
+import functools
 import os
+import pickle
+import types
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from sklearn import preprocessing
 
+from dtype_optimizer import optimize_dtypes
+from stage_cache import CACHE_DIR
+from terminology import TerminologyIndex
+
+SUMMARY_FOLDER = '../cleaned_data/Shanghai_diabetes_datasets/clinical_info/csv'
+SUMMARY_FILES = ['Shanghai_T1DM_Summary.csv', 'Shanghai_T2DM_Summary.csv']
+SUMMARY_VERSION = 2  # bump when the preprocessing in main() changes - invalidates its cached artifacts
+FITTED_PREPROCESSOR_PATH = CACHE_DIR / 'fitted' / 'summary_preprocessor.pkl'
+
 
 class DiabetesDataPreprocessor:
-    def __init__(self, folder_path):
-        self.folder_path = Path(folder_path)
-        self.df = None
-        self._validate_path()
+    numeric_columns = [
+        'Age (years)', 'Height (m)', 'Weight (kg)', 'BMI (kg/m2)',
+        'Smoking History (pack year)', 'Duration of Diabetes (years)',
+        'Fasting Plasma Glucose (mg/dl)', '2-hour Postprandial Plasma Glucose (mg/dl)',
+        'Fasting C-peptide (nmol/L)', '2-hour Postprandial C-peptide (nmol/L)',
+        'Fasting Insulin (pmol/L)', '2-hour Postprandial Insulin (pmol/L)',
+        'HbA1c (mmol/mol)', 'Glycated Albumin (%)', 'Total Cholesterol (mmol/L)',
+        'Triglyceride (mmol/L)', 'High-Density Lipoprotein Cholesterol (mmol/L)',
+        'Low-Density Lipoprotein Cholesterol (mmol/L)', 'Creatinine (umol/L)',
+        'Estimated Glomerular Filtration Rate  (ml/min/1.73m2)',
+        'Uric Acid (mmol/L)', 'Blood Urea Nitrogen (mmol/L)'
+    ]
+
+    # rows at or above these values are dropped as outliers
+    outlier_thresholds = {
+        'Fasting Insulin (pmol/L)': 700,
+        '2-hour Postprandial Insulin (pmol/L)': 800,
+    }
+
+    def __init__(self, folder_path=None, df=None):
+        self.folder_path = None if folder_path is None else Path(folder_path)
+        self.df = df
+        self.unknown_agents = {}  # column name -> agents add_group_flags found no group for
+        self.medians = {}  # column -> median filled in by handle_missing_values
+        self.label_classes = {}  # column -> classes of its label encoding, code = position
+        if self.folder_path is not None:
+            self._validate_path()
+
+    @classmethod
+    def from_frame(cls, df):
+        """Preprocessor over an already loaded frame (e.g. new patients), no folder needed"""
+        return cls(df=df)
 
     def _validate_path(self):
         if not os.path.exists(self.folder_path):
@@ -16,28 +57,15 @@ class DiabetesDataPreprocessor:
 
     def load_and_combine_data(self):
         """Load and combine T1DM and T2DM datasets"""
-        df1 = pd.read_csv(self.folder_path.joinpath('Shanghai_T1DM_Summary.csv'))
-        df2 = pd.read_csv(self.folder_path.joinpath('Shanghai_T2DM_Summary.csv'))
-
-        self.df = pd.concat([df1, df2], ignore_index=True)
+        self.df = pd.concat([pd.read_csv(self.folder_path.joinpath(name)) for name in SUMMARY_FILES],
+                            ignore_index=True)
         return self
 
-    def handle_missing_values(self):
-        """Handle missing values in the dataset"""
+    def handle_missing_values(self, medians=None):
+        """Handle missing values in the dataset, with the given medians or the ones of this frame"""
         self.df.replace('/', pd.NA, inplace=True)
 
-        cols_to_fill = [
-            'Age (years)', 'Height (m)', 'Weight (kg)', 'BMI (kg/m2)',
-            'Smoking History (pack year)', 'Duration of Diabetes (years)',
-            'Fasting Plasma Glucose (mg/dl)', '2-hour Postprandial Plasma Glucose (mg/dl)',
-            'Fasting C-peptide (nmol/L)', '2-hour Postprandial C-peptide (nmol/L)',
-            'Fasting Insulin (pmol/L)', '2-hour Postprandial Insulin (pmol/L)',
-            'HbA1c (mmol/mol)', 'Glycated Albumin (%)', 'Total Cholesterol (mmol/L)',
-            'Triglyceride (mmol/L)', 'High-Density Lipoprotein Cholesterol (mmol/L)',
-            'Low-Density Lipoprotein Cholesterol (mmol/L)', 'Creatinine (umol/L)',
-            'Estimated Glomerular Filtration Rate  (ml/min/1.73m2)',
-            'Uric Acid (mmol/L)', 'Blood Urea Nitrogen (mmol/L)'
-        ]
+        cols_to_fill = self.numeric_columns
 
         for col in cols_to_fill:
             if col in self.df.columns:
@@ -46,39 +74,36 @@ class DiabetesDataPreprocessor:
                     errors='coerce'
                 )
 
-        self.df[cols_to_fill] = self.df[cols_to_fill].fillna(self.df[cols_to_fill].median())
+        self.medians = self.df[cols_to_fill].median().to_dict() if medians is None else dict(medians)
+
+        self.df[cols_to_fill] = self.df[cols_to_fill].fillna(self.medians)
         return self
 
-    def clean_data(self):
+    def clean_data(self, outlier_thresholds=None):
         """Remove outliers and fix full_data errors"""
-        self.df = self.df[self.df['Fasting Insulin (pmol/L)'] < 700]
-        self.df = self.df[self.df['2-hour Postprandial Insulin (pmol/L)'] < 800]
-
-        # Fix specific errors in Other Agents column
-        fixes = {
-            'raberazole': 'rabeprazole',
-            'calcium carbonate and vitamin D3 tablet': 'calcium carbonate, vitamin D3 tablet',
-            'rosuvastatinqn': 'rosuvastatin',
-            'nifedipine doxazosin': 'nifedipine, doxazosin'
-        }
+        thresholds = self.outlier_thresholds if outlier_thresholds is None else outlier_thresholds
 
-        for wrong, correct in fixes.items():
-            self.df['Other Agents'] = self.df['Other Agents'].str.replace(wrong, correct)
+        for col, threshold in thresholds.items():
+            self.df = self.df[self.df[col] < threshold]
 
+        # misspelled / merged agent names are resolved by the terminology index in add_group_flags,
+        # see DiabetesFeatureEngineer.drug_aliases
         return self
 
     def add_group_flags(self, column_name, items_to_group):
-        """Create binary flags for grouped items"""
-        all_groups = sorted(set(items_to_group.values()))
+        """
+        Create binary flags for grouped items (a grouping dict or a TerminologyIndex),
+        agents without a group are kept in self.unknown_agents
+        """
+        flags, unknown = DiabetesFeatureEngineer.encode_groups(self.df[column_name], items_to_group)
 
-        def parse_agents(row):
-            if pd.isna(row): return []
-            return [agent.strip() for agent in row.split(',')]
+        self.df = self.df.assign(**flags.add_prefix('has_'))
+        self.unknown_agents[column_name] = unknown
 
-        for group in all_groups:
-            self.df[f'has_{group}'] = self.df[column_name].apply(
-                lambda x: int(any(items_to_group.get(agent) == group for agent in parse_agents(x)))
-            )
+        if unknown and isinstance(items_to_group, TerminologyIndex):
+            suggestions = {agent: items_to_group.suggest(agent) for agent in unknown}
+            print(f"{column_name}: {len(unknown)} agents without a group: " + ', '.join(
+                f"{agent} (near {', '.join(near)}?)" if near else agent for agent, near in suggestions.items()))
 
         self.df = self.df.drop(columns=[column_name], axis=1)
         return self
@@ -100,11 +125,17 @@ class DiabetesDataPreprocessor:
         self.df = self.df.drop(columns=[column_name])
         return self
 
-    def encode_categorical(self, columns):
-        """Label encode categorical columns"""
+    def encode_categorical(self, columns, label_classes=None):
+        """Label encode categorical columns, with the given classes (unseen values → -1) or fitted on this frame"""
         label_encoder = preprocessing.LabelEncoder()
         for col in columns:
-            self.df[col] = label_encoder.fit_transform(self.df[col])
+            if label_classes is None:
+                self.label_classes[col] = label_encoder.fit(self.df[col]).classes_.tolist()
+            else:
+                self.label_classes[col] = list(label_classes[col])
+
+            codes = {value: code for code, value in enumerate(self.label_classes[col])}
+            self.df[col] = self.df[col].map(codes).fillna(-1).astype('int64')
         return self
 
     def rename_column(self, old_name, new_name):
@@ -118,32 +149,84 @@ class DiabetesDataPreprocessor:
         self.df = self.df.drop(columns=columns)
         return self
 
+    def optimize_dtypes(self, report=True):
+        """Downcast columns: has_* flags to int8, lab values to float32, Patient Number to category"""
+        self.df = optimize_dtypes(self.df, categorical=['Patient Number'], report=report)
+        return self
+
     def get_data(self):
         """Return the processed dataframe"""
         return self.df
 
 
 class DiabetesFeatureEngineer:
+    TERMINOLOGY_VERSION = 2  # bump when the index itself changes; edits of the groupings are picked up by content
+
+    # names in the summary data that aren't terms of the groupings: misspellings and two agents without a comma
+    drug_aliases = {
+        'raberazole': ['rabeprazole'],
+        'calcium carbonate and vitamin D3 tablet': ['calcium carbonate', 'vitamin D3 tablet'],
+        'rosuvastatinqn': ['rosuvastatin'],
+        'nifedipine doxazosin': ['nifedipine', 'doxazosin'],
+    }
+
     @staticmethod
-    def find_unknown_agents(df, col_name, items_to_group):
-        """Find unknown agents not in the grouping dictionary"""
-        all_agents = set()
+    @functools.cache
+    def drug_index():
+        """Terminology index of get_drug_groupings, built once and kept on disk"""
+        return TerminologyIndex.load_or_build('drugs', DiabetesFeatureEngineer.get_drug_groupings(),
+                                              DiabetesFeatureEngineer.drug_aliases,
+                                              DiabetesFeatureEngineer.TERMINOLOGY_VERSION)
+
+    @staticmethod
+    @functools.cache
+    def disease_index():
+        """Terminology index of get_disease_groupings, built once and kept on disk"""
+        return TerminologyIndex.load_or_build('diseases', DiabetesFeatureEngineer.get_disease_groupings(),
+                                              version=DiabetesFeatureEngineer.TERMINOLOGY_VERSION)
+
+    @staticmethod
+    def encode_groups(column, items_to_group):
+        """
+        Multi-hot group flags of a comma-separated column in one pass, plus the agents without a group.
+
+        "metformin, aspirin" → explode → one row per agent → groups (each distinct agent looked up once) →
+        the (row, group) pairs are set to 1 in a (rows × groups) matrix at once. items_to_group is a grouping
+        dict (exact names) or a TerminologyIndex built once by the caller (normalized names and aliases).
+        Returns (flags with one int column per group, sorted list of unknown agents - 'none' excluded).
+        """
+        if isinstance(items_to_group, TerminologyIndex):
+            all_groups, lookup = sorted(set(items_to_group.groups.values())), items_to_group.group
+        else:
+            all_groups = sorted(set(items_to_group.values()))
+            lookup = lambda agent: [items_to_group[agent]] if agent in items_to_group else []
 
-        for elem in df[col_name]:
-            agents = [agent.strip() for agent in elem.split(',')]
-            all_agents.update(agents)
+        # object dtype: a column read as all-NaN (e.g. one new patient without agents) is float64, .str would raise
+        positions = pd.Series(column.to_numpy(dtype=object), index=np.arange(len(column)))
+        agents = positions.str.split(',').explode().str.strip().dropna()
+        agent_groups = {agent: lookup(agent) for agent in agents.unique()}
+        groups = agents.map(agent_groups).explode().dropna()  # an alias can give two groups, unknown ([]) → NaN
 
-        unknown_agents = sorted(
-            [unk_ag for unk_ag in all_agents
-             if unk_ag not in items_to_group and unk_ag.lower() != 'none']
-        )
+        codes = pd.Categorical(groups, categories=all_groups).codes
 
-        return unknown_agents
+        # scatter instead of crosstab: crosstab's groupby/pivot costs seconds on 50k rows, this milliseconds
+        matrix = np.zeros((len(column), len(all_groups)), dtype=np.int64)
+        matrix[groups.index.to_numpy(), codes] = 1
+
+        unknown = sorted(agent for agent, found in agent_groups.items() if not found and agent.lower() != 'none')
+
+        return pd.DataFrame(matrix, index=column.index, columns=all_groups), unknown
 
     @staticmethod
+    def find_unknown_agents(df, col_name, items_to_group):
+        """Find unknown agents not in the grouping dictionary"""
+        return DiabetesFeatureEngineer.encode_groups(df[col_name], items_to_group)[1]
+
+    @staticmethod
+    @functools.cache
     def get_drug_groupings():
-        """Return dictionary for drug groupings"""
-        return {
+        """Return read-only mapping for drug groupings"""
+        return types.MappingProxyType({
             # hypolipidemic
             'pravastatin': 'hypolipidemic',
             'rosuvastatin': 'hypolipidemic',
@@ -251,12 +334,13 @@ class DiabetesFeatureEngineer:
 
             # vestibular disorders
             'betahistine': 'vestibular_disorders',
-        }
+        })
 
     @staticmethod
+    @functools.cache
     def get_disease_groupings():
-        """Return dictionary for disease groupings"""
-        return {
+        """Return read-only mapping for disease groupings"""
+        return types.MappingProxyType({
             # diseases_of_the_stomach_and_intestines
             'chronic atrophic gastritis': 'diseases_of_the_stomach_and_intestines',
             'colorectal polyp': 'diseases_of_the_stomach_and_intestines',
@@ -342,36 +426,111 @@ class DiabetesFeatureEngineer:
             'hypokalemia': 'electrolyte_and_mineral_disorders',
             'vitamin D deficiency': 'electrolyte_and_mineral_disorders',
             'hyperuricemia': 'electrolyte_and_mineral_disorders',
-        }
-
-
-def main():
-    # Initialize preprocessor
-    preprocessor = DiabetesDataPreprocessor('../cleaned_data/Shanghai_diabetes_datasets/clinical_info/csv')
-
-    # Load and process full_data
-    df = (preprocessor
-          .load_and_combine_data()
-          .handle_missing_values()
-          .clean_data()
-          .add_group_flags('Other Agents', DiabetesFeatureEngineer.get_drug_groupings())
-          .add_group_flags('Comorbidities', DiabetesFeatureEngineer.get_disease_groupings())
-          .drop_columns(['Hypoglycemic Agents'])
-          .specify_has_or_no('Diabetic Microvascular Complications')
-          .specify_has_or_no('Diabetic Macrovascular  Complications')
-          .specify_has_or_no('Acute Diabetic Complications')
-          .encode_categorical([
+        })
+
+
+class FittedSummaryPreprocessor:
+    """
+    the summary pipeline of main() with everything it learns from the cohort kept: medians, label classes,
+    outlier thresholds and group vocabularies (terminology indices). fit once on the cohort and save;
+    transform then processes one new patient or a small batch in milliseconds, without the cohort.
+    """
+
+    categorical_columns = [
         'Alcohol Drinking History (drinker/non-drinker)',
         'Hypoglycemia (yes/no)',
         'Type of Diabetes'
-    ])
-          .rename_column('Hypoglycemia (yes/no)', 'has_hypoglycemia')
-          .get_data())
+    ]
+
+    def __init__(self):
+        self.medians = None
+        self.label_classes = None
+        self.outlier_thresholds = dict(DiabetesDataPreprocessor.outlier_thresholds)
+        self.drug_index = DiabetesFeatureEngineer.drug_index()
+        self.disease_index = DiabetesFeatureEngineer.disease_index()
+        self.columns = None  # output columns, transform returns exactly these
+        self.source_key = None  # stage cache key of the summary files it was fitted on, see main()
+
+    @property
+    def is_fitted(self):
+        return self.medians is not None
+
+    def fit(self, folder_path=SUMMARY_FOLDER):
+        """Fits on the summary csv files of the folder and returns the processed cohort (the frame of main())"""
+        preprocessor = DiabetesDataPreprocessor(folder_path).load_and_combine_data()
+        df = self._pipeline(preprocessor, fitted=False).get_data()
+
+        self.medians = preprocessor.medians
+        self.label_classes = preprocessor.label_classes
+        self.columns = list(df.columns)
+        return df
+
+    def transform(self, df, drop_outliers=False):
+        """
+        Raw summary rows (columns of the summary csv) → the processed frame, with the fitted state only.
+        Rows are kept whatever their values unless drop_outliers - a new patient is never filtered away
+        """
+        if not self.is_fitted:
+            raise ValueError("FittedSummaryPreprocessor is not fitted, call fit or load first")
+
+        preprocessor = DiabetesDataPreprocessor.from_frame(df.copy())
+        processed = self._pipeline(preprocessor, fitted=True, drop_outliers=drop_outliers).get_data()
+        return processed.reindex(columns=self.columns)
+
+    def _pipeline(self, preprocessor, fitted, drop_outliers=True):
+        return (preprocessor
+                .handle_missing_values(self.medians if fitted else None)
+                .clean_data(self.outlier_thresholds if drop_outliers else {})
+                .add_group_flags('Other Agents', self.drug_index)
+                .add_group_flags('Comorbidities', self.disease_index)
+                .drop_columns(['Hypoglycemic Agents'])
+                .specify_has_or_no('Diabetic Microvascular Complications')
+                .specify_has_or_no('Diabetic Macrovascular  Complications')
+                .specify_has_or_no('Acute Diabetic Complications')
+                .encode_categorical(self.categorical_columns, self.label_classes if fitted else None)
+                .rename_column('Hypoglycemia (yes/no)', 'has_hypoglycemia'))
+
+    def save(self, path=FITTED_PREPROCESSOR_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+        return path
+
+    @staticmethod
+    def load(path=FITTED_PREPROCESSOR_PATH):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+def summary_cache_key(cache):
+    return cache.key('summary', SUMMARY_VERSION, *[Path(SUMMARY_FOLDER) / name for name in SUMMARY_FILES])
+
+
+def main(cache=None, fitted_path=None):
+    """
+    processed summary cohort; with fitted_path the fitted preprocessor is saved there for transform later.
+    with a cache the cohort is loaded from its artifact - unless fitted_path has no preprocessor fitted on
+    the same summary files, then both are fitted and written again
+    """
+    key = None if cache is None else summary_cache_key(cache)
+
+    if key is not None and cache.has(key):
+        if fitted_path is None:
+            return cache.load(key)
+        if Path(fitted_path).exists() and FittedSummaryPreprocessor.load(fitted_path).source_key == key:
+            print(f"Fitted preprocessor {fitted_path} is up to date")
+            return cache.load(key)
+
+    fitted = FittedSummaryPreprocessor()
+    df = fitted.fit(SUMMARY_FOLDER)
+    fitted.source_key = key
 
+    if fitted_path is not None:
+        fitted.save(fitted_path)
 
     print(f"Final dataframe shape: {df.shape}")
-    return df
+    return df if key is None else cache.store(key, df)
 
 
 if __name__ == "__main__":
-    df = main()
+    df = main(fitted_path=FITTED_PREPROCESSOR_PATH)
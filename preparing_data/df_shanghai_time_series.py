@@ -1,44 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 
 
 class DfShanghaiTimeSeries:
-    def __init__(self, folder_path):
+    CACHE_VERSION = 2  # bump when merge_all_data_ts changes - invalidates its cached artifacts
+    folders = ['T1DM', 'T2DM']
+
+    # raw header -> canonical column; headers are stripped afterwards
+    column_renames = {
+        'CGM ': 'CGM (mg / dl)',
+        'CBG ': 'CBG (mg / dl)',
+
+        'Blood Ketone ': 'Blood Ketone (mmol / L)',
+        'CSII - bolus insulin (Novolin R  IU)': 'CSII - bolus insulin (Novolin R, IU)',
+        'CSII - bolus insulin': 'CSII - bolus insulin (Novolin R, IU)',
+
+        'CSII - basal insulin (Novolin R  IU / H)': 'CSII - basal insulin (Novolin R, IU / H)',
+        '胰岛素泵基础量 (Novolin R, IU / H)': 'CSII - basal insulin (Novolin R, IU / H)',
+        'CSII - basal insulin': 'CSII - basal insulin (Novolin R, IU / H)',
+    }
+
+    # canonical columns that are never read (usecols)
+    dropped_columns = {
+        '饮食',
+        # 'Date'
+        '进食量',
+        'CSII - bolus insulin',
+        'CSII - basal insulin',
+    }
+
+    # canonical column -> dtype; text stays object (no per-value str conversion), the CSII columns
+    # mix numbers and text and stay inferred
+    column_dtypes = {
+        'Date': object,
+        'CGM (mg / dl)': 'float64',
+        'CBG (mg / dl)': 'float64',
+        'Blood Ketone (mmol / L)': 'float64',
+        'Insulin dose - s.c.': object,
+        'Insulin dose - i.v.': object,
+        'Non-insulin hypoglycemic agents': object,
+        'Dietary intake': object,
+    }
+
+    def __init__(self, folder_path, cache=None, workers=None):
         self.folder_path = Path(folder_path)
         self.combined_data = None
+        self.cache = cache  # optional StageCache
+        self.workers = workers or os.cpu_count()
+
+    def input_files(self):
+        return sorted(file for folder in self.folders for file in (self.folder_path / folder).glob('*.csv'))
+
+    def cache_key(self, cache):
+        return cache.key('time_series', self.CACHE_VERSION, *self.input_files())
+
+    @classmethod
+    def canonical_column(cls, raw_name):
+        """canonical name of a raw csv header, None for the columns that are dropped"""
+        name = cls.column_renames.get(raw_name, raw_name).strip()
+        return None if name in cls.dropped_columns else name
+
+    @classmethod
+    def raw_dtypes(cls):
+        """column_dtypes for every known raw header of a canonical column - read_csv ignores absent ones"""
+        dtypes = dict(cls.column_dtypes)
+        for raw, name in cls.column_renames.items():
+            if name in cls.column_dtypes:
+                dtypes[raw] = cls.column_dtypes[name]
+        return dtypes
 
     def merge_all_data_ts(self):
-        folders = ['T1DM', 'T2DM']
-        all_data = []
-
-        for folder in folders:
-            folder_path = self.folder_path / folder
-
-            if not folder_path.exists():
-                print(f"folder not found: {folder_path}")
+        if self.cache is not None:
+            self.combined_data = self.cache.cached(self.cache_key(self.cache), self._merge_all_data_ts)
+            return self.combined_data
 
-            for file in folder_path.glob('*.csv'):
-                try:
-                    df = pd.read_csv(file)
+        return self._merge_all_data_ts()
 
-                    df['Patient Number'] = file.stem
+    def _merge_all_data_ts(self):
+        for folder in self.folders:
+            if not (self.folder_path / folder).exists():
+                print(f"folder not found: {self.folder_path / folder}")
 
-                    df.rename(columns={
-                        'CGM ': 'CGM (mg / dl)',
-                        'CBG ': 'CBG (mg / dl)',
+        files = self.input_files()
 
-                        'Blood Ketone ': 'Blood Ketone (mmol / L)',
-                        'CSII - bolus insulin (Novolin R  IU)': 'CSII - bolus insulin (Novolin R, IU)',
-                        'CSII - bolus insulin': 'CSII - bolus insulin (Novolin R, IU)',
+        # one patient per file - files are read in parallel, results come back in file order
+        if self.workers > 1 and len(files) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(files))) as executor:
+                results = list(executor.map(_read_patient_file, files, chunksize=8))
+        else:
+            results = [_read_patient_file(file) for file in files]
 
-                        'CSII - basal insulin (Novolin R  IU / H)': 'CSII - basal insulin (Novolin R, IU / H)',
-                        '胰岛素泵基础量 (Novolin R, IU / H)': 'CSII - basal insulin (Novolin R, IU / H)',
-                        'CSII - basal insulin': 'CSII - basal insulin (Novolin R, IU / H)',
-                    }, inplace=True)
-
-                    all_data.append(df)
-                except Exception as e:
-                    print(f'error reading {file}: {e}')
+        all_data = []
+        for file, (df, error) in zip(files, results):
+            if error is not None:
+                print(f'error reading {file}: {error}')
+            else:
+                all_data.append(df)
 
         if not all_data:
             print("no full_data loaded")
@@ -48,15 +107,24 @@ class DfShanghaiTimeSeries:
 
         combined_df['Dietary intake'] = combined_df['Dietary intake'].notna().astype(int)
 
-        combined_df.columns = [col.strip() for col in combined_df.columns]
-
-        combined_df.drop(columns=[
-            '饮食',
-            # 'Date'
-            '进食量',
-            'CSII - bolus insulin',
-            'CSII - basal insulin'
-        ], inplace=True)
-
         self.combined_data = combined_df
         return self.combined_data
+
+
+def _read_patient_file(file):
+    # module level so the process pool can pickle it; returns (frame, None) or (None, error message)
+    usecols = lambda raw: DfShanghaiTimeSeries.canonical_column(raw) is not None
+
+    try:
+        try:
+            df = pd.read_csv(file, usecols=usecols, dtype=DfShanghaiTimeSeries.raw_dtypes())
+        except ValueError as e:
+            # e.g. text in a numeric column - read this file with inferred dtypes as before
+            print(f'{file.name}: {e}, reading with inferred dtypes')
+            df = pd.read_csv(file, usecols=usecols)
+
+        df = df.rename(columns=DfShanghaiTimeSeries.canonical_column)
+        df['Patient Number'] = file.stem
+        return df, None
+    except Exception as e:
+        return None, str(e)
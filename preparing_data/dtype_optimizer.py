@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+def optimize_dtypes(frame, categorical=(), integer=(), report=True):
+    """
+    smallest dtypes that hold the same values:
+
+    ➤ categorical columns (e.g. 'Patient Number') → category, every id string is stored once
+    ➤ integer columns (e.g. the time parts) → smallest int, nullable (Int8 / Int16 ...) where values are missing;
+      a column with fractional values keeps its float dtype
+    ➤ other int columns → int8 for 0/1 flags (has_*), otherwise the smallest int
+    ➤ float64 columns → float32 (measurements, lab values, doses - sparse ones stay sparse)
+
+    text columns are left as they are. prints a per-column memory report with report=True.
+    """
+    optimized = {}
+
+    for col, dtype in frame.dtypes.items():
+        values = frame[col]
+
+        if col in categorical:
+            optimized[col] = values.astype('category')
+        elif col in integer:
+            optimized[col] = _smallest_int(values)
+        elif pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.SparseDtype):
+            optimized[col] = _smallest_int(values)  # 0/1 flags end up as int8
+        elif isinstance(dtype, pd.SparseDtype):
+            if dtype.subtype == np.float64:
+                optimized[col] = values.astype(pd.SparseDtype(np.float32, 0))
+        elif dtype == np.float64:
+            optimized[col] = values.astype(np.float32)
+
+    result = frame.assign(**optimized) if optimized else frame
+
+    if report:
+        memory_report(frame, result)
+
+    return result
+
+
+def _smallest_int(values):
+    numbers = pd.to_numeric(values, errors='coerce')
+    present = numbers.dropna()
+
+    if not (present % 1 == 0).all():
+        return values  # fractional values (e.g. 1.5 in an `integer` column) keep their float dtype
+
+    has_missing = len(present) < len(numbers)
+
+    for int_type, nullable in ((np.int8, 'Int8'), (np.int16, 'Int16'), (np.int32, 'Int32'), (np.int64, 'Int64')):
+        limits = np.iinfo(int_type)
+        if present.between(limits.min, limits.max).all():
+            return numbers.astype(nullable if has_missing else int_type)
+
+    return values
+
+
+def memory_report(before, after, label='dtypes'):
+    before_bytes = before.memory_usage(deep=True, index=False)
+    after_bytes = after.memory_usage(deep=True, index=False)
+
+    for col in before.columns:
+        if before[col].dtype != after[col].dtype:
+            print(f'[{label}] {col}: {before[col].dtype} → {after[col].dtype}, '
+                  f'{before_bytes[col] / 1024:,.1f} KB → {after_bytes[col] / 1024:,.1f} KB')
+
+    total_before, total_after = before_bytes.sum(), after_bytes.sum()
+    saved = 1 - total_after / total_before if total_before else 0.0
+    print(f'[{label}] total: {total_before / 1024 ** 2:,.1f} MB → {total_after / 1024 ** 2:,.1f} MB ({saved:.0%} less)')
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class ParseCache:
+    """
+    bounded LRU cache for parsing repetitive free-text columns.
+
+    a column is factorized into codes and uniques; only the uniques go through the parser, and of those
+    only the ones not already cached (from an earlier column or an earlier run of the same parser).
+    entries are keyed by (parser name, cell value), so parsers sharing the cache never see each other's results.
+    cached results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # (parser name, value) -> parsed result, least recently used first
+        self.stats = {}  # parser name -> {'rows', 'uniques', 'hits', 'misses'}
+
+    def parse_column(self, column, parser, name=None, vectorized=False):
+        """
+        returns (codes, parsed): codes as from pd.factorize (-1 for empty cells) and one parsed result per unique,
+        so parsed[codes[i]] is the result for row i.
+
+        parser takes one cell value, or with vectorized=True a Series of all uniques that are not cached yet
+        (one str.* pass over them) and returns one result per value, in their order.
+        """
+        name = name or parser.__name__
+        stats = self.stats.setdefault(name, {'rows': 0, 'uniques': 0, 'hits': 0, 'misses': 0})
+
+        codes, uniques = pd.factorize(column)
+
+        # results are kept here, not read back from entries: storing a new one may evict another of this column
+        parsed = [None] * len(uniques)
+        missing = []
+        for position, value in enumerate(uniques):
+            key = (name, value)
+
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                parsed[position] = self.entries[key]
+            else:
+                missing.append(position)
+
+        if missing:
+            values = [uniques[position] for position in missing]
+            results = parser(pd.Series(values, dtype=object)) if vectorized else [parser(value) for value in values]
+
+            for position, value, result in zip(missing, values, results):
+                parsed[position] = result
+                self._store((name, value), result)
+
+        stats['rows'] += len(codes)
+        stats['uniques'] += len(uniques)
+        stats['hits'] += len(uniques) - len(missing)
+        stats['misses'] += len(missing)
+
+        return codes, parsed
+
+    def _store(self, key, result):
+        self.entries[key] = result
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.stats.clear()
+
+    def report(self):
+        for name, stats in self.stats.items():
+            rows, uniques, hits, misses = stats['rows'], stats['uniques'], stats['hits'], stats['misses']
+
+            hit_rate = hits / uniques if uniques else 0.0
+            avoided = 1 - misses / rows if rows else 0.0
+
+            print(f'[parse cache] {name}: {rows} rows, {uniques} distinct, {misses} parsed, {hits} cached '
+                  f'(hit rate {hit_rate:.1%}, {avoided:.1%} of row parses avoided)')
+
+        print(f'[parse cache] {len(self.entries)} / {self.maxsize} entries')
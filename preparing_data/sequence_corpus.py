@@ -0,0 +1,211 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CORPUS_VERSION = 1  # bump when the file layout changes - SequenceCorpus checks it against meta.json
+
+SEQUENCE_COLUMNS = ['CGM (mg / dl)', 'CBG (mg / dl)', 'Blood Ketone (mmol / L)']
+
+CORPUS_FILES = {
+    'sequences': 'sequences.npy',  # float32 (rows, sequence features), rows grouped by patient in time order
+    'targets': 'targets.npy',      # float32 (rows, 2): insulin and non-insulin dose totals of the row
+    'therapy': 'therapy.npy',      # int8 (rows,): 0 none / tablets, 1 insulin, 2 both
+    'static': 'static.npy',        # float32 (patients, static features)
+    'offsets': 'offsets.npy',      # int64 (patients + 1,): rows of patient p are offsets[p]:offsets[p + 1]
+}
+
+
+def write_sequence_corpus(frame, path, static_columns, sequence_columns=None):
+    """
+    writes the frame as plain .npy arrays that training code memory-maps (np.load(..., mmap_mode='r')):
+    a window of a patient is a slice of sequences.npy, nothing is parsed at startup or per epoch.
+
+    ➤ sequence_columns default to CGM / CBG / blood ketone and every dose_* column
+    ➤ static features are taken from the first row of each patient
+    ➤ targets are the per-row insulin / non-insulin dose totals and the therapy type derived from them
+
+    meta.json (version, columns, patient ids, file names) is written last, an existing corpus at path is replaced.
+    """
+    path = Path(path)
+    dose_cols = [col for col in frame.columns if col.startswith('dose_')]
+    if sequence_columns is None:
+        sequence_columns = [col for col in SEQUENCE_COLUMNS if col in frame.columns] + dose_cols
+
+    order, offsets, patient_ids = patient_order(frame['Patient Number'])
+
+    insulin = row_totals(frame, [col for col in dose_cols if 'insulin' in col])
+    tablet = row_totals(frame, [col for col in dose_cols if 'insulin' not in col])
+    therapy = np.where(insulin > 0, np.where(tablet > 0, 2, 1), 0).astype(np.int8)
+
+    arrays = {
+        'sequences': _float32(frame, sequence_columns)[order],
+        'targets': np.column_stack((insulin, tablet))[order],
+        'therapy': therapy[order],
+        'static': _float32(frame, static_columns)[order[offsets[:-1]]],
+        'offsets': offsets,
+    }
+
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+
+    for name, array in arrays.items():
+        np.save(path / CORPUS_FILES[name], np.ascontiguousarray(array))
+
+    meta = {
+        'version': CORPUS_VERSION,
+        'files': CORPUS_FILES,
+        'sequence_columns': list(sequence_columns),
+        'static_columns': list(static_columns),
+        'target_columns': ['insulin', 'tablet'],
+        'patient_ids': [str(patient_id) for patient_id in patient_ids],
+        'rows': int(len(order)),
+    }
+    with open(path / 'meta.json', 'w') as file:
+        json.dump(meta, file, indent=2, ensure_ascii=False)
+
+    size = sum((path / name).stat().st_size for name in CORPUS_FILES.values())
+    print(f'sequence corpus: {len(order)} rows, {len(patient_ids)} patients, '
+          f'{len(sequence_columns)} sequence features → {path} ({size / 1024 ** 2:.1f} MB)')
+    return path
+
+
+def _float32(frame, columns):
+    # sparse dose_* columns (DfFullData sparse_doses) are densified column by column
+    return np.column_stack([
+        frame[col].sparse.to_dense().to_numpy(dtype=np.float32) if isinstance(frame[col].dtype, pd.SparseDtype)
+        else frame[col].to_numpy(dtype=np.float32)
+        for col in columns
+    ]) if columns else np.zeros((len(frame), 0), dtype=np.float32)
+
+
+def patient_order(patient_numbers):
+    """
+    rows grouped by patient: (order, offsets, patient ids). order is one stable sort of the row positions by
+    patient, so the time order within a patient is kept; the rows of patient p are order[offsets[p]:offsets[p + 1]].
+    rows without a Patient Number (factorize code -1) belong to no patient's sequence and are left out.
+    """
+    codes, patient_ids = pd.factorize(patient_numbers)
+
+    known = np.flatnonzero(codes >= 0)
+    if len(known) < len(codes):
+        print(f'{len(codes) - len(known)} rows without a Patient Number left out of the sequences')
+
+    order = known[np.argsort(codes[known], kind='stable')]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes[known], minlength=len(patient_ids))))).astype(np.int64)
+    return order, offsets, patient_ids
+
+
+def row_totals(frame, columns):
+    """per-row sum of the dose columns as float32; sparse dose_* columns are summed as CSR"""
+    if not columns:
+        return np.zeros(len(frame), dtype=np.float32)
+
+    doses = frame[columns]
+    if all(isinstance(dtype, pd.SparseDtype) for dtype in doses.dtypes):
+        return np.asarray(doses.sparse.to_coo().tocsr().sum(axis=1), dtype=np.float32).ravel()
+
+    return doses.to_numpy(dtype=np.float32).sum(axis=1)
+
+
+def window_index(offsets, seq_len, stride=1, horizon=0, last_only=False):
+    """
+    full windows over patient-grouped rows: (first rows, patients, target rows).
+
+    ➤ a window starts every `stride` rows and stays inside one patient
+    ➤ its target is the row `horizon` steps after its last row: start + seq_len - 1 + horizon
+    ➤ last_only=True keeps one window per patient, ending `horizon` rows before the patient's last row
+    """
+    first = offsets[:-1]
+    last = offsets[1:] - seq_len - horizon  # last valid start of every patient
+    if last_only:
+        first = np.maximum(first, last)
+
+    counts = np.where(last >= first, (last - first) // stride + 1, 0)
+    patients = np.repeat(np.arange(len(first)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    starts = first[patients] + steps * stride
+
+    return starts, patients, starts + seq_len - 1 + horizon
+
+
+def short_windows(offsets, seq_len, horizon=0):
+    """
+    patients with fewer than seq_len + horizon rows get one window, zero-padded at the front: (patients, target rows).
+    the target is the patient's last row; patients with no more than `horizon` rows get none
+    """
+    lengths = offsets[1:] - offsets[:-1]
+    patients = np.flatnonzero((lengths < seq_len + horizon) & (lengths > horizon))
+    return patients, offsets[patients + 1] - 1
+
+
+class SequenceCorpus:
+    """
+    sliding windows over a corpus written by write_sequence_corpus, as numpy arrays.
+
+    the .npy files are memory-mapped: startup reads meta.json and offsets.npy only, and a sample is a slice of
+    seq_len rows - no pandas, no parsing. windows are those of window_index plus short_windows, so a corpus
+    yields the samples DiabetesDataset.get_dataset yields for the same frame.
+
+    the maps are opened lazily in each process, so DataLoader workers share the page cache instead of
+    pickling the arrays.
+    """
+
+    def __init__(self, path, seq_len=20, stride=1, horizon=0):
+        self.path = Path(path)
+        self.seq_len = seq_len
+        self.horizon = horizon
+
+        with open(self.path / 'meta.json') as file:
+            self.meta = json.load(file)
+
+        if self.meta['version'] != CORPUS_VERSION:
+            raise ValueError(f"corpus {self.path} has version {self.meta['version']}, expected {CORPUS_VERSION}")
+
+        self.sequence_columns = self.meta['sequence_columns']
+        self.static_columns = self.meta['static_columns']
+        self.patient_ids = self.meta['patient_ids']
+
+        offsets = np.load(self.path / self.meta['files']['offsets'])
+        starts, patients, targets = window_index(offsets, seq_len, stride, horizon)
+        short, short_targets = short_windows(offsets, seq_len, horizon)
+
+        # (first row, target row, patient) of every window; first rows before the patient's start are padding
+        self.windows = np.concatenate((
+            np.column_stack((starts, targets, patients)),
+            np.column_stack((short_targets - horizon - seq_len + 1, short_targets, short)),
+        )).astype(np.int64)
+        self._arrays = None
+
+    def _maps(self):
+        if self._arrays is None:
+            files = self.meta['files']
+            self._arrays = {
+                name: np.load(self.path / files[name], mmap_mode='r')
+                for name in ('sequences', 'targets', 'therapy', 'static', 'offsets')
+            }
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None  # reopened in the worker
+        return state
+
+    def __len__(self):
+        return len(self.windows)
+
+    def sample(self, index):
+        """((sequence, static), (therapy, insulin, tablet)) of a window"""
+        arrays = self._maps()
+        start, target, patient = self.windows[index]
+
+        patient_start = arrays['offsets'][patient]
+        seq = np.array(arrays['sequences'][max(start, patient_start):start + self.seq_len])
+        if len(seq) < self.seq_len:
+            seq = np.vstack((np.zeros((self.seq_len - len(seq), seq.shape[1]), dtype=np.float32), seq))
+
+        insulin, tablet = arrays['targets'][target]
+        return (seq, np.array(arrays['static'][patient])), (int(arrays['therapy'][target]), insulin, tablet)
@@ -0,0 +1,112 @@
+import hashlib
+import time
+from pathlib import Path
+
+import pandas as pd
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / 'cache'  # <repo>/cache, wherever the pipeline is run from
+
+
+class StageCache:
+    """
+    on-disk parquet artifacts of the preprocessing stages.
+
+    a stage key hashes the stage name, the version of its code and its inputs: csv files (by content)
+    or the keys of upstream stages. keys are computed without running or loading anything, so a later stage
+    is loaded straight from its artifact, and changing it never re-runs the stages before it.
+
+    artifacts are evicted least recently used first once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.file_hashes = {}  # (path, size, mtime) -> sha256, every file is read once per process
+
+    def key(self, stage, version, *inputs):
+        digest = hashlib.sha256(f'{stage}:v{version}'.encode())
+
+        for item in inputs:
+            digest.update((self._file_hash(item) if isinstance(item, Path) else str(item)).encode())
+
+        return f'{stage}_{digest.hexdigest()[:20]}'
+
+    def _file_hash(self, path):
+        stat = path.stat()
+        memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+        if memo_key not in self.file_hashes:
+            digest = hashlib.sha256(f'{path.parent.name}/{path.name}'.encode())
+
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+
+            self.file_hashes[memo_key] = digest.hexdigest()
+
+        return self.file_hashes[memo_key]
+
+    def path(self, key):
+        return self.cache_dir / f'{key}.parquet'
+
+    def has(self, key):
+        return self.path(key).exists()
+
+    def load(self, key):
+        path = self.path(key)
+        path.touch()  # mtime doubles as last use for the eviction
+
+        print(f'[stage cache] {key}: loaded')
+        return pd.read_parquet(path)
+
+    def store(self, key, frame):
+        """writes the frame and returns it unchanged - only the written copy is made parquet-safe"""
+        path = self.path(key)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix('.partial')
+        densify(self._parquet_safe(frame)).to_parquet(partial)
+        partial.replace(path)  # readers never see a half-written artifact
+
+        print(f'[stage cache] {key}: stored ({path.stat().st_size / 1024 ** 2:.1f} MB)')
+        self.evict(keep=path)
+        return frame
+
+    def cached(self, key, compute):
+        if self.has(key):
+            return self.load(key)
+
+        started = time.perf_counter()
+        frame = compute()
+        print(f'[stage cache] {key}: computed in {time.perf_counter() - started:.2f}s')
+
+        return self.store(key, frame)
+
+    def evict(self, keep=None):
+        artifacts = sorted(self.cache_dir.glob('*.parquet'), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in artifacts)
+
+        for path in artifacts:
+            if total <= self.max_bytes: break
+            if path == keep: continue
+
+            total -= path.stat().st_size
+            path.unlink()
+            print(f'[stage cache] {path.stem}: evicted')
+
+    @staticmethod
+    def _parquet_safe(frame):
+        # object columns mixing numbers and text (e.g. CSII: 1.5 and "temporarily suspend insulin delivery")
+        # can't be stored in parquet - the artifact keeps them as text, which the normalizers parse the same way
+        mixed = {
+            col: frame[col].where(frame[col].isna(), frame[col].astype(str))
+            for col in frame.columns[frame.dtypes == object]
+            if frame[col].dropna().map(type).nunique() > 1
+        }
+        return frame.assign(**mixed) if mixed else frame
+
+
+def densify(frame):
+    """sparse columns (e.g. DfFullData sparse_doses) as dense ones - parquet / arrow have no sparse type"""
+    sparse = {col: frame[col].sparse.to_dense() for col, dtype in frame.dtypes.items() if isinstance(dtype, pd.SparseDtype)}
+    return frame.assign(**sparse) if sparse else frame
@@ -0,0 +1,117 @@
+import hashlib
+import pickle
+import re
+from collections import Counter
+from pathlib import Path
+
+from stage_cache import CACHE_DIR
+
+
+class TerminologyIndex:
+    """
+    term → group lookup for free-text agent / disease names.
+
+    ➤ exact: normalized term (lowercase, single spaces) → canonical term
+    ➤ aliases: known misspellings or merged entries → one or more canonical terms,
+      e.g. 'nifedipine doxazosin' → ('nifedipine', 'doxazosin')
+    ➤ anything else is unknown: suggest lists its near-misses (a trigram index gives a few candidates,
+      kept if they share min_trigram_overlap of their trigrams and are within max_distance_ratio edits),
+      so a misspelling can be added to the aliases after review
+    ➤ fuzzy=True accepts the closest near-miss instead - opt-in, since names a few letters apart can be
+      clinically opposite ('hyperthyroidism' / 'hypothyroidism')
+
+    resolved names are memoized, so normalizing thousands of rows costs one lookup per distinct name.
+    build it with load_or_build: the index is pickled under a key of version + content and reused.
+    """
+
+    def __init__(self, groups, aliases=None, version=1, fuzzy=False, max_distance_ratio=0.2, min_trigram_overlap=0.5,
+                 min_fuzzy_length=5):
+        self.version = version
+        self.groups = dict(groups)  # canonical term -> group
+        self.fuzzy = fuzzy
+        self.max_distance_ratio = max_distance_ratio
+        self.min_trigram_overlap = min_trigram_overlap
+        self.min_fuzzy_length = min_fuzzy_length
+
+        self.exact = {self.normalize(term): (term,) for term in self.groups}
+        for alias, terms in (aliases or {}).items():
+            self.exact[self.normalize(alias)] = tuple(terms)
+
+        self.terms = list(self.groups)
+        self.trigrams = {}  # trigram -> ids of the canonical terms containing it
+        for term_id, term in enumerate(self.terms):
+            for trigram in self._trigrams(self.normalize(term)):
+                self.trigrams.setdefault(trigram, set()).add(term_id)
+
+        self.resolved = {}  # raw name -> canonical terms, memo of resolve
+
+    @classmethod
+    def load_or_build(cls, name, groups, aliases=None, version=1, fuzzy=False, cache_dir=CACHE_DIR / 'terminology'):
+        key = hashlib.sha256(repr((version, fuzzy, sorted(groups.items()), sorted((aliases or {}).items()))).encode())
+        path = Path(cache_dir) / f'{name}_v{version}_{key.hexdigest()[:16]}.pkl'
+
+        if path.exists():
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+
+        index = cls(groups, aliases, version, fuzzy)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as file:
+            pickle.dump(index, file)
+
+        return index
+
+    @staticmethod
+    def normalize(name):
+        return re.sub(r'\s+', ' ', name.strip().lower())
+
+    @staticmethod
+    def _trigrams(text):
+        padded = f'  {text} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def resolve(self, name):
+        """canonical terms of a raw name, () when it is unknown"""
+        if name not in self.resolved:
+            normalized = self.normalize(name)
+            self.resolved[name] = self.exact.get(normalized) or (self._near_misses(normalized)[:1] if self.fuzzy else ())
+        return self.resolved[name]
+
+    def group(self, name):
+        """groups of a raw name (one per canonical term it resolves to)"""
+        return [self.groups[term] for term in self.resolve(name)]
+
+    def suggest(self, name, candidates=3):
+        """near-miss canonical terms of a raw name, closest first - for reviewing unknown names"""
+        return self._near_misses(self.normalize(name))[:candidates]
+
+    def _near_misses(self, normalized, candidates=5):
+        if len(normalized) < self.min_fuzzy_length:
+            return ()
+
+        trigrams = self._trigrams(normalized)
+        shared = Counter(term_id for trigram in trigrams for term_id in self.trigrams.get(trigram, ()))
+
+        near = []
+        for term_id, count in shared.most_common(candidates):
+            term = self.normalize(self.terms[term_id])
+            if count < self.min_trigram_overlap * max(len(trigrams), len(self._trigrams(term))):
+                continue
+            distance = _edit_distance(normalized, term)
+            if distance <= self.max_distance_ratio * len(normalized):
+                near.append((distance, self.terms[term_id]))
+
+        return tuple(term for _, term in sorted(near, key=lambda item: item[0]))
+
+
+def _edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+
+    return previous[-1]
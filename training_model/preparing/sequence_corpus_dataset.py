@@ -0,0 +1,23 @@
+import torch
+from torch.utils.data import Dataset
+
+from preparing_data.sequence_corpus import SequenceCorpus
+
+
+class SequenceCorpusDataset(SequenceCorpus, Dataset):
+    """
+    torch view of a SequenceCorpus (preparing_data/sequence_corpus.py), the corpus written by
+    DfFullData.export_sequence_corpus: the same windows, as tensors.
+
+    windows start every `stride` rows and stay inside one patient; the targets (therapy, insulin, tablet) are
+    those of the row `horizon` steps after the window's last row. patients shorter than seq_len + horizon get
+    one window, zero-padded at the front.
+    """
+
+    def __getitem__(self, index):
+        (seq, static), (therapy, insulin, tablet) = self.sample(index)
+
+        return (
+            (torch.from_numpy(seq), torch.from_numpy(static)),
+            (torch.tensor(therapy), torch.tensor(insulin), torch.tensor(tablet)),
+        )
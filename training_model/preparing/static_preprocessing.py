@@ -1,5 +1,7 @@
 from locale import normalize
 
+import numpy as np
+import pandas as pd
 import torch
 from sklearn.preprocessing import MinMaxScaler
 
@@ -87,3 +89,41 @@ class StaticProcessing:
         static_tensor = torch.tensor(normalize_raw_static_features, dtype=torch.float32)
 
         return static_tensor, drug_indices, comorb_indices
+
+    @staticmethod
+    def get_static_tensor(static_features):
+        normalize_raw_static_features = StaticProcessing.normalize_features(static_features.to_numpy())
+        return torch.tensor(normalize_raw_static_features, dtype=torch.float32)
+
+    @staticmethod
+    def pad_indices(offsets, values):
+        """
+        CSR indices (Repository.get_entity_indices) -> zero-padded int64 array of shape (patients, max_len),
+        the same layout pad_sequence produces in StaticEmbedderEncoder.
+
+        offsets = [0, 3, 5, 5], values = [3, 7, 1, 5, 2] -> [[3, 7, 1], [5, 2, 0], [0, 0, 0]]
+        """
+        lengths = np.diff(offsets)
+        padded = np.zeros((len(lengths), max(int(lengths.max(initial=0)), 1)), dtype=np.int64)
+
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        cols = np.arange(len(values)) - np.repeat(offsets[:-1], lengths)
+        padded[rows, cols] = values
+
+        return padded
+
+    @staticmethod
+    def align_indices(patient_ids, offsets, values, order):
+        """
+        pad_indices rows in the order of `order` (e.g. static_features.index). a patient missing from
+        patient_ids gets an all-padding row - get_indexer gives -1 for it, which would pick the last patient's row.
+        """
+        positions = pd.Index(patient_ids).get_indexer(order)
+        aligned = StaticProcessing.pad_indices(offsets, values)[positions]
+
+        missing = positions == -1
+        if missing.any():
+            print(f'{int(missing.sum())} patients without entity indices, padded with zeros')
+            aligned[missing] = 0
+
+        return aligned
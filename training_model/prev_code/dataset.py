@@ -1,5 +1,8 @@
 import tensorflow as tf
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from preparing_data.sequence_corpus import patient_order, row_totals, short_windows, window_index
 
 class DiabetesDataset:
     def __init__(self, df, seq_cols, static_cols, seq_len=20):
@@ -7,22 +10,59 @@ class DiabetesDataset:
         self.seq_cols = seq_cols
         self.static_cols = static_cols
         self.seq_len = seq_len
-        self.patients = df['Patient Number'].unique()
         self.num_seq_features = len(seq_cols)
 
-    def get_dataset(self):
-        def gen():
-            for pid in self.patients:
-                patient_df = self.df[self.df['Patient Number'] == pid]
-                static = patient_df.iloc[0][self.static_cols].values.astype(np.float32)
-                seq = patient_df[self.seq_cols].tail(self.seq_len).values.astype(np.float32)
-                seq = self._pad_sequence(seq)
+        # per-row insulin / tablet totals once for the whole frame; sparse dose_* columns are summed as CSR
+        dose_cols = [col for col in df.columns if col.startswith('dose_')]
+        self.insulin_total = row_totals(df, [col for col in dose_cols if 'insulin' in col])
+        self.tablet_total = row_totals(df, [col for col in dose_cols if 'insulin' not in col])
+
+        # one stable sort by patient: the rows of patient p are offsets[p]:offsets[p + 1], in their original order
+        self.order, self.offsets, self.patients = patient_order(df['Patient Number'])
+
+        self.seq_values = np.ascontiguousarray(df[self.seq_cols].to_numpy(dtype=np.float32)[self.order])
+        self.static_values = df[self.static_cols].to_numpy(dtype=np.float32)[self.order[self.offsets[:-1]]]
+        self.insulin_sorted = self.insulin_total[self.order]
+        self.tablet_sorted = self.tablet_total[self.order]
+
+    def build_windows(self, stride=1, horizon=0, last_only=False):
+        """
+        sliding windows over the patient-sorted sequence array, without copying it:
+
+        ➤ windows: sliding_window_view of seq_values, windows[i] is the (seq_len, features) view of rows i:i + seq_len
+        ➤ starts, patients, targets: window_index of the patient offsets, see preparing_data/sequence_corpus.py
+          (horizon=0 → the target is the last row of the window)
+
+        returns (windows, starts, patient of each start, target rows)
+        """
+        if len(self.seq_values) >= self.seq_len:
+            windows = sliding_window_view(self.seq_values, self.seq_len, axis=0).transpose(0, 2, 1)
+        else:
+            windows = np.empty((0, self.seq_len, self.num_seq_features), dtype=np.float32)
 
-                therapy = self._determine_therapy_type(patient_df)
-                insulin = patient_df[[col for col in patient_df.columns if col.startswith('dose_') and 'insulin' in col]].sum(axis=1).iloc[-1]
-                tablet = patient_df[[col for col in patient_df.columns if col.startswith('dose_') and 'insulin' not in col]].sum(axis=1).iloc[-1]
+        return (windows, *window_index(self.offsets, self.seq_len, stride, horizon, last_only))
+
+    def get_dataset(self, stride=1, horizon=0, last_only=False):
+        windows, starts, patients, targets = self.build_windows(stride, horizon, last_only)
+
+        # patients with fewer than seq_len + horizon rows get their single, zero-padded window as before
+        short, short_targets = short_windows(self.offsets, self.seq_len, horizon)
+
+        def sample(seq, patient, target):
+            insulin = self.insulin_sorted[target]
+            tablet = self.tablet_sorted[target]
+            therapy = self._determine_therapy_type(insulin, tablet)
+
+            return (seq, self.static_values[patient]), (therapy, insulin, tablet)
+
+        def gen():
+            for start, patient, target in zip(starts, patients, targets):
+                yield sample(windows[start], patient, target)
 
-                yield (seq, static), (therapy, insulin, tablet)
+            for patient, target in zip(short, short_targets):
+                # the window ends `horizon` rows before the target, as for the full windows
+                seq = self._pad_sequence(self.seq_values[self.offsets[patient]:target - horizon + 1])
+                yield sample(seq, patient, target)
 
         return tf.data.Dataset.from_generator(
             gen,
@@ -45,10 +85,10 @@ class DiabetesDataset:
         return seq
 
     @staticmethod
-    def _determine_therapy_type(df):
-        last = df.iloc[-1]
-        has_insulin = any(last[col] > 0 for col in df.columns if 'dose_' in col and 'insulin' in col)
-        has_tablet = any(last[col] > 0 for col in df.columns if 'dose_' in col and 'insulin' not in col)
+    def _determine_therapy_type(insulin, tablet):
+        # doses are never negative: "any dose > 0" is "total > 0"
+        has_insulin = insulin > 0
+        has_tablet = tablet > 0
         if has_insulin and has_tablet:
             return 2
         elif has_insulin:
@@ -3,6 +3,7 @@ import sys
 from pathlib import Path
 
 import pandas as pd
+import pyarrow.dataset as ds
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
 import tensorflow as tf
@@ -50,14 +51,21 @@ static_cols = [
 BATCH_SIZE = 32
 EPOCHS = 10
 SEQ_LEN = 20
+STRIDE = 5  # rows between two training windows of a patient
 INPUT_DIM = len(seq_cols)
 STATIC_DIM = len(static_cols)
 HIDDEN_DIM = 64
 
-df = pd.read_csv(Path('../cleaned_data/train_data.csv'))
+# DfFullData.export_parquet dataset: only the used columns of the train split are read
+DATASET_PATH = Path('../cleaned_data/shanghai_parquet')
+dose_cols = [col for col in ds.dataset(DATASET_PATH, partitioning='hive').schema.names if col.startswith('dose_')]
 
-dataset = DiabetesDataset(df, seq_cols, static_cols, seq_len=SEQ_LEN).get_dataset()
-dataset = dataset.shuffle(100).batch(BATCH_SIZE)
+df = pd.read_parquet(DATASET_PATH, columns=['Patient Number'] + seq_cols + static_cols + dose_cols,
+                     filters=[('split', '==', 'train')])
+
+dataset = DiabetesDataset(df, seq_cols, static_cols, seq_len=SEQ_LEN).get_dataset(stride=STRIDE)
+# windows of one patient come out next to each other - the buffer has to span many patients
+dataset = dataset.shuffle(10_000).batch(BATCH_SIZE)
 
 model = DiabetesLSTMModel(INPUT_DIM, HIDDEN_DIM, STATIC_DIM)
 
@@ -1,10 +1,42 @@
-from sqlalchemy.orm import sessionmaker
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import sessionmaker, joinedload
 
 from db.engine import engine
-from db.models import Patient, DatasetPartition, AdditionalDrugs, Comorbidities
+from db.models import Patient, DatasetPartition, AdditionalDrugs, Comorbidities, PatientMedicalStatic
 
 
 class Repository:
+    # the 24 static model features, in the order StaticProcessing feeds them to the encoder
+    static_feature_columns = [
+        Patient.gender,
+        Patient.age,
+        Patient.height,
+        Patient.weight,
+        Patient.smoking_history,
+        Patient.alcohol_drinking_history,
+        PatientMedicalStatic.diabetes_type,
+        PatientMedicalStatic.diabetes_duration_years,
+        PatientMedicalStatic.fasting_glucose,
+        PatientMedicalStatic.postprandial_glucose,
+        PatientMedicalStatic.fasting_c_peptide,
+        PatientMedicalStatic.postprandial_c_peptide,
+        PatientMedicalStatic.fasting_insulin,
+        PatientMedicalStatic.postprandial_insulin,
+        PatientMedicalStatic.hba1c,
+        PatientMedicalStatic.glycated_albumin,
+        PatientMedicalStatic.total_cholesterol,
+        PatientMedicalStatic.triglyceride,
+        PatientMedicalStatic.hdl,
+        PatientMedicalStatic.ldl,
+        PatientMedicalStatic.creatinine,
+        PatientMedicalStatic.egfr,
+        PatientMedicalStatic.uric_acid,
+        PatientMedicalStatic.bun,
+    ]
+
     def __init__(self):
         Session = sessionmaker(bind=engine)
         self.session = Session()
@@ -13,11 +45,77 @@ class Repository:
         return (
             self.session
             .query(Patient)
+            .options(joinedload(Patient.medical_static))  # loaded in the same query, not one SELECT per patient
             .join(DatasetPartition)
             .filter(DatasetPartition.name == 'train')
             .all()
         )
 
+    def get_static_features(self, partition_name='train'):
+        """
+        static features of every patient of the partition as a float DataFrame indexed by patient id.
+        one joined query that selects only the feature columns - no Patient objects and no lazy
+        medical_static load per patient.
+        """
+        query = (
+            select(Patient.id.label('patient_id'), *self.static_feature_columns)
+            .join(PatientMedicalStatic, PatientMedicalStatic.patient_id == Patient.id)
+            .join(DatasetPartition, DatasetPartition.id == Patient.dataset_partition_id)
+            .where(DatasetPartition.name == partition_name)
+            .order_by(Patient.id)
+        )
+        result = self.session.execute(query)
+
+        frame = pd.DataFrame(result.all(), columns=list(result.keys()))
+        return frame.set_index('patient_id').astype('float64')  # None -> NaN
+
+    def get_entity_indices(self, entity_model, partition_name='train', vocabulary_partition='train'):
+        """
+        embedding indices of AdditionalDrugs / Comorbidities per patient of a partition, in one query.
+
+        indices are dense_rank over the entity *names* of vocabulary_partition (1..vocabulary_size,
+        0 stays free for padding), so train and test use the same numbering and names unknown to the
+        vocabulary are dropped. aggregated per patient with array_agg and returned in CSR form:
+        the indices of patient_ids[i] are values[offsets[i]:offsets[i + 1]].
+
+        :return: patient_ids, offsets, values, vocabulary_size
+        """
+        vocabulary_names = (
+            select(entity_model.name)
+            .join(Patient, Patient.id == entity_model.patient_id)
+            .join(DatasetPartition, DatasetPartition.id == Patient.dataset_partition_id)
+            .where(DatasetPartition.name == vocabulary_partition)
+            .distinct()
+            .subquery()
+        )
+        vocabulary = select(
+            vocabulary_names.c.name,
+            func.dense_rank().over(order_by=vocabulary_names.c.name).label('idx')
+        ).cte('vocabulary')
+
+        indices = func.array_agg(aggregate_order_by(vocabulary.c.idx, vocabulary.c.idx)) \
+            .filter(vocabulary.c.idx.isnot(None))
+        vocabulary_size = select(func.count()).select_from(vocabulary).scalar_subquery()
+
+        query = (
+            select(Patient.id, indices.label('indices'), vocabulary_size.label('vocabulary_size'))
+            .join(DatasetPartition, DatasetPartition.id == Patient.dataset_partition_id)
+            .outerjoin(entity_model, entity_model.patient_id == Patient.id)
+            .outerjoin(vocabulary, vocabulary.c.name == entity_model.name)
+            .where(DatasetPartition.name == partition_name)
+            .group_by(Patient.id)
+            .order_by(Patient.id)
+        )
+        rows = self.session.execute(query).all()
+
+        patient_ids = [row.id for row in rows]
+        lengths = np.array([len(row.indices or []) for row in rows], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        values = np.fromiter((idx for row in rows for idx in (row.indices or [])), dtype=np.int64, count=offsets[-1])
+        vocabulary_size = rows[0].vocabulary_size if rows else 0
+
+        return patient_ids, offsets, values, vocabulary_size
+
     def get_patient_drugs_map(self):
         query = (
             self.session
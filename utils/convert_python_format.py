@@ -9,3 +9,8 @@ def to_python_format(val):
         return val.item()  # np.int64, np.float64 → int, float
 
     return val
+
+
+def to_python_records(frame):
+    # NaN / <NA> -> None and numpy scalars -> python scalars, ready for ORM constructors or executemany
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')